@@ -2,9 +2,10 @@ import asyncio
 import json
 import os
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import datetime, timezone
 
-from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi import FastAPI, File, Form, Query, Request, UploadFile
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from nanoid import generate
@@ -27,9 +28,10 @@ from service.health import (
 )
 from service.llm import check_valid_model, get_models
 from service.log import logger
-from service.mq import initialize_mq, publish_task
-from service.resource import SystemMonitor
+from service.mq import close_mq, initialize_mq, publish_task
+from service.resource import get_system_monitor
 from service.storage import get_file_url, initialize_storage, upload_file
+from service.translate_cache import purge_translation_cache
 
 tags_metadata = [
     {"name": "api"},
@@ -64,9 +66,10 @@ async def lifespan(app: FastAPI):
 
         logger.info("All services initialized successfully")
     except Exception as e:
-        logger.error(f"Error during initialization: {str(e)}")
+        logger.error("Error during initialization: %s", e)
     yield
     logger.info("Shutting down...")
+    await close_mq()
 
 
 app = FastAPI(
@@ -94,6 +97,7 @@ async def translate_endpoint(
     provider: str = Form(None),
     model: str = Form(None),
     api_key: str = Form(None),
+    use_cache: bool = Form(True),
 ) -> JSONResponse:
     try:
         data = await file.read()
@@ -102,7 +106,7 @@ async def translate_endpoint(
         task_id = generate()
         basename, ext = os.path.splitext(file.filename)
         filename = f"{basename}-{task_id}{ext}"
-        logger.info(f"[{task_id}] {filename} | {provider} / {model}")
+        logger.info("[%s] %s | %s / %s", task_id, filename, provider, model)
 
         if provider and model:
             if provider != "ollama" and not api_key:
@@ -129,13 +133,13 @@ async def translate_endpoint(
                 400,
                 "ファイルのアップロードに失敗しました",
             )
-        logger.info(f"File uploaded successfully: {filename}")
+        logger.info("File uploaded successfully: %s", filename)
 
         # Prepare task data for the queue
         task_data = {
             "task_id": task_id,
             "status": TaskStatus.PENDING.value,
-            "created_at": datetime.now().isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "filename": filename,
             "content_type": file.content_type,
             "original_url": get_file_url(f"uploads/{filename}"),
@@ -145,6 +149,7 @@ async def translate_endpoint(
             "provider": provider,
             "model_name": model,
             "api_key": api_key,
+            "use_cache": use_cache,
         }
 
         # Store the initial task information in the database
@@ -164,11 +169,11 @@ async def translate_endpoint(
                 "タスクのキューへの追加に失敗しました",
             )
 
-        logger.info(f"Translation task queued successfully: {task_id}")
+        logger.info("Translation task queued successfully: %s", task_id)
 
         return create_response()
     except Exception as e:
-        logger.error(f"Translation request error: {str(e)}")
+        logger.error("Translation request error: %s", e)
         return create_response(
             400,
             "タスクのキューへの追加に失敗しました",
@@ -193,10 +198,8 @@ async def task_updates_sse(request: Request):
 
                 # Fetch all tasks from database
                 try:
-                    tasks = await get_all_tasks()
-
                     # Check for status changes
-                    for task in tasks:
+                    async for task in get_all_tasks(fields=["task_id", "status"]):
                         task_id = task.get("task_id")
                         current_status = task.get("status")
 
@@ -213,21 +216,23 @@ async def task_updates_sse(request: Request):
 
                             yield f"event: update\ndata: {json.dumps(update_data)}\n\n"
                             logger.info(
-                                f"Sent SSE update for task {task_id}: {current_status}"
+                                "Sent SSE update for task %s: %s",
+                                task_id,
+                                current_status,
                             )
 
                         # Update last known status
                         last_check[task_id] = current_status
 
                 except Exception as e:
-                    logger.error(f"Error fetching tasks for SSE: {str(e)}")
+                    logger.error("Error fetching tasks for SSE: %s", e)
                     yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
 
                 # Wait before polling again (adjust as needed)
                 await asyncio.sleep(2)
 
         except Exception as e:
-            logger.error(f"SSE error: {str(e)}")
+            logger.error("SSE error: %s", e)
             yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
 
         finally:
@@ -244,20 +249,45 @@ async def task_updates_sse(request: Request):
 
 
 @app.get("/tasks", tags=["api"])
-async def get_tasks_endpoint():
+async def get_tasks_endpoint(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(0, ge=0),
+):
+    tasks = get_all_tasks(skip=skip, limit=limit)
     try:
-        return await get_all_tasks()
+        # Fetch the first task up front so connection errors still return 400
+        first_task = await anext(tasks, None)
     except Exception as e:
-        logger.error(f"Translation history error: {str(e)}")
+        logger.error("Translation history error: %s", e)
         return create_response(400, str(e))
 
+    async def json_array_generator():
+        # Stream the task list as a JSON array without materializing it
+        yield "["
+        if first_task is not None:
+            yield json.dumps(jsonable_encoder(first_task))
+        try:
+            async for task in tasks:
+                yield "," + json.dumps(jsonable_encoder(task))
+        except Exception as e:
+            # Abort the stream so the client sees an incomplete response
+            # instead of a well-formed but truncated list
+            logger.error("Translation history error: %s", e)
+            raise
+        yield "]"
+
+    return StreamingResponse(
+        json_array_generator(),
+        media_type="application/json",
+    )
+
 
 @app.get("/task/{task_id}", tags=["api"])
 async def get_task_endpoint(task_id: str):
     try:
         return await get_task(task_id)
     except Exception as e:
-        logger.error(f"Translation history error: {str(e)}")
+        logger.error("Translation history error: %s", e)
         return create_response(400, str(e))
 
 
@@ -266,7 +296,16 @@ async def delete_task_endpoint(task_id: str):
     try:
         return await delete_task(task_id)
     except Exception as e:
-        logger.error(f"Translation history error: {str(e)}")
+        logger.error("Translation history error: %s", e)
+        return create_response(400, str(e))
+
+
+@app.delete("/translation-cache", tags=["api"])
+async def purge_translation_cache_endpoint():
+    try:
+        return await purge_translation_cache()
+    except Exception as e:
+        logger.error("Translation cache purge error: %s", e)
         return create_response(400, str(e))
 
 
@@ -275,7 +314,7 @@ async def get_models_endpoint():
     try:
         return await get_models()
     except Exception as e:
-        logger.error(f"Model list error: {str(e)}")
+        logger.error("Model list error: %s", e)
         return create_response(400, str(e))
 
 
@@ -285,7 +324,7 @@ async def health_backend():
     try:
         return await health_check_backend()
     except Exception as e:
-        logger.error(f"Backend health check error: {str(e)}")
+        logger.error("Backend health check error: %s", e)
         return create_response(400, str(e))
 
 
@@ -294,7 +333,7 @@ async def health_ollama():
     try:
         return await health_check_ollama()
     except Exception as e:
-        logger.error(f"Ollama health check error: {str(e)}")
+        logger.error("Ollama health check error: %s", e)
         return create_response(400, str(e))
 
 
@@ -303,7 +342,7 @@ async def health_db():
     try:
         return await health_check_db()
     except Exception as e:
-        logger.error(f"DB health check error: {str(e)}")
+        logger.error("DB health check error: %s", e)
         return create_response(400, str(e))
 
 
@@ -312,7 +351,7 @@ async def health_mq():
     try:
         return await health_check_mq()
     except Exception as e:
-        logger.error(f"MQ health check error: {str(e)}")
+        logger.error("MQ health check error: %s", e)
         return create_response(400, str(e))
 
 
@@ -321,17 +360,18 @@ async def health_storage():
     try:
         return await health_check_storage()
     except Exception as e:
-        logger.error(f"Storage health check error: {str(e)}")
+        logger.error("Storage health check error: %s", e)
         return create_response(400, str(e))
 
 
 @app.get("/resource", tags=["status"])
 async def resource_endpoint():
     try:
-        system_monitor = SystemMonitor()
-        return system_monitor.get_system_info()
+        # The first call builds the monitor, which runs nvidia-smi, so it
+        # happens in the thread too
+        return await asyncio.to_thread(lambda: get_system_monitor().get_system_info())
     except Exception as e:
-        logger.error(f"Resource check error: {str(e)}")
+        logger.error("Resource check error: %s", e)
         return create_response(400, str(e))
 
 
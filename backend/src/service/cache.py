@@ -0,0 +1,32 @@
+import asyncio
+import functools
+import time
+
+
+def ttl_cache(ttl: float, cache_if=None):
+    """
+    Cache the result of an argument-less coroutine for `ttl` seconds.
+    Concurrent callers share a single upstream call while it is in flight.
+    If `cache_if` is given, results it rejects are returned but not cached.
+    Call `.cache_clear()` on the decorated function to invalidate it.
+    """
+
+    def decorator(func):
+        lock = asyncio.Lock()
+        cache = {}
+
+        @functools.wraps(func)
+        async def wrapper():
+            async with lock:
+                if "value" in cache and time.monotonic() - cache["time"] < ttl:
+                    return cache["value"]
+                value = await func()
+                if cache_if is None or cache_if(value):
+                    cache["value"] = value
+                    cache["time"] = time.monotonic()
+                return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -1,8 +1,14 @@
+import asyncio
+import functools
+import itertools
 import os
+import threading
+from collections.abc import AsyncIterator
 from enum import Enum
 
-from pymongo import MongoClient
-from pymongo.errors import OperationFailure
+from pymongo import MongoClient, WriteConcern
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 
 from service.log import logger
 
@@ -13,6 +19,20 @@ MONGO_USERNAME = os.getenv("MONGO_INITDB_ROOT_USERNAME", "root")
 MONGO_PASSWORD = os.getenv("MONGO_INITDB_ROOT_PASSWORD", "example")
 MONGO_DB = os.getenv("MONGO_DB", "leadable")
 MONGO_COLLECTION_TASKS = "tasks"
+MONGO_COLLECTION_TRANSLATION_CACHE = "translation_cache"
+# Seconds a cached translation is kept (default: 7 days)
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", str(7 * 24 * 60 * 60)))
+# Write concern for write-once task records ("1", "majority", ...)
+MONGO_HISTORY_WRITE_CONCERN = os.getenv("MONGO_HISTORY_WRITE_CONCERN", "1")
+
+# Number of documents fetched per round trip when streaming tasks
+TASKS_BATCH_SIZE = 1000
+
+# Unique index on task_id from before task_id became the _id
+LEGACY_TASK_ID_INDEX = "task_id_1"
+
+# Fields that API responses never need (secrets and internal data)
+TASK_EXCLUDED_FIELDS = {"api_key": 0}
 
 
 class TaskStatus(str, Enum):
@@ -22,21 +42,36 @@ class TaskStatus(str, Enum):
     FAILED = "failed"
 
 
-def get_mongo_client():
-    try:
-        connection_string = (
-            f"mongodb://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/"
-        )
-        # Increase timeout settings
-        return MongoClient(
-            connection_string,
-            serverSelectionTimeoutMS=30000,  # 30 seconds
-            connectTimeoutMS=30000,  # 30 seconds
-            socketTimeoutMS=30000,  # 30 seconds
-        )
-    except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {str(e)}")
-        raise
+# Shared client so every operation uses the driver's connection pool
+_client: MongoClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_mongo_client() -> MongoClient:
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            try:
+                connection_string = f"mongodb://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/"
+                # Increase timeout settings
+                _client = MongoClient(
+                    connection_string,
+                    serverSelectionTimeoutMS=30000,  # 30 seconds
+                    connectTimeoutMS=30000,  # 30 seconds
+                    socketTimeoutMS=30000,  # 30 seconds
+                    tz_aware=True,  # Return stored dates as UTC-aware datetimes
+                    retryWrites=True,
+                    retryReads=True,
+                    maxPoolSize=50,
+                    minPoolSize=5,
+                )
+            except Exception as e:
+                logger.error("Failed to connect to MongoDB: %s", e)
+                raise
+    return _client
 
 
 def get_database(database_name=MONGO_DB):
@@ -44,110 +79,223 @@ def get_database(database_name=MONGO_DB):
     return client[database_name]
 
 
-def get_collection(collection_name, database_name=MONGO_DB):
+def get_collection(collection_name, database_name=MONGO_DB, write_concern=None):
     db = get_database(database_name)
-    return db[collection_name]
+    return db.get_collection(collection_name, write_concern=write_concern)
 
 
-async def update_task_status(task_id: str, status: str):
-    try:
-        tasks_collection = get_collection(MONGO_COLLECTION_TASKS)
-        result = tasks_collection.update_one(
-            {"task_id": task_id}, {"$set": {"status": status}}
-        )
+def get_history_write_concern() -> WriteConcern:
+    w = MONGO_HISTORY_WRITE_CONCERN
+    return WriteConcern(w=int(w) if w.isdigit() else w, j=False)
 
-        if result.matched_count == 0:
-            logger.warning(f"Task {task_id} not found when updating status to {status}")
-            return False
 
-        logger.info(f"Updated task {task_id} status to {status}")
-        return True
-    except Exception as e:
-        logger.error(f"Error updating task status for {task_id}: {str(e)}")
+# Collection handles are bound once on first use and reused afterwards
+@functools.cache
+def get_tasks_collection() -> Collection:
+    return get_collection(MONGO_COLLECTION_TASKS)
+
+
+@functools.cache
+def get_tasks_history_collection() -> Collection:
+    return get_collection(
+        MONGO_COLLECTION_TASKS, write_concern=get_history_write_concern()
+    )
+
+
+def db_errors(default=None):
+    """
+    Log MongoDB errors and return `default` instead of raising.
+    Other exceptions propagate unchanged.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except PyMongoError as e:
+                logger.error("MongoDB error in %s: %s", func.__name__, e)
+                return default
+
+        return wrapper
+
+    return decorator
+
+
+@db_errors(default=False)
+async def update_task_status(task_id: str, status: str) -> bool:
+    """
+    Update the task status. Returns False when the task does not exist.
+    """
+    tasks_collection = get_tasks_collection()
+    result = await asyncio.to_thread(
+        tasks_collection.update_one,
+        {"_id": task_id},
+        # The server clock stamps the change as a native BSON date
+        {"$set": {"status": status}, "$currentDate": {"updated_at": True}},
+    )
+
+    if result.matched_count == 0:
+        logger.warning("Task %s not found when updating status to %s", task_id, status)
         return False
 
+    logger.info("Updated task %s status to %s", task_id, status)
+    return True
+
 
+@db_errors(default=False)
 async def store_result(task_data: dict) -> bool:
-    try:
-        tasks_collection = get_collection(MONGO_COLLECTION_TASKS)
-        tasks_collection.insert_one(task_data)
-        return True
-    except Exception as e:
-        logger.error(f"Error storing result: {str(e)}")
-        return False
+    tasks_collection = get_tasks_history_collection()
+    # The task ID doubles as the primary key, so no extra unique index is needed.
+    # A copy is inserted because the caller publishes task_data afterwards.
+    document = {**task_data, "_id": task_data["task_id"]}
+    await asyncio.to_thread(tasks_collection.insert_one, document)
+    return True
 
 
-async def get_all_tasks():
-    try:
-        tasks_collection = get_collection(MONGO_COLLECTION_TASKS)
-        cursor = tasks_collection.find({})
-        results = []
-        for doc in cursor:
-            if "_id" in doc and hasattr(doc["_id"], "__str__"):
-                doc["_id"] = str(doc["_id"])
-            results.append(doc)
-        return results
-    except Exception as e:
-        logger.error(f"Error fetching all results: {str(e)}")
-        raise
+def build_projection(fields: list[str] | None) -> dict | None:
+    if not fields:
+        return None
+    return {field: 1 for field in fields}
+
 
+def fetch_batch(cursor, size: int) -> list[dict]:
+    return list(itertools.islice(cursor, size))
 
-async def get_task(task_id: str):
+
+# Read/delete errors propagate so the API layer can report them
+async def get_all_tasks(
+    fields: list[str] | None = None, skip: int = 0, limit: int = 0
+) -> AsyncIterator[dict]:
+    """
+    Stream tasks, newest first. A limit of 0 means no limit.
+    """
+    tasks_collection = get_tasks_collection()
+    projection = build_projection(fields) or TASK_EXCLUDED_FIELDS
+    cursor = (
+        tasks_collection.find({}, projection=projection, batch_size=TASKS_BATCH_SIZE)
+        .sort("created_at", -1)
+        .skip(skip)
+        .limit(limit)
+    )
     try:
-        tasks_collection = get_collection(MONGO_COLLECTION_TASKS)
-        result = tasks_collection.find_one({"task_id": task_id})
-        if not result:
-            return {"error": "Task not found"}
-        if "_id" in result and hasattr(result["_id"], "__str__"):
-            result["_id"] = str(result["_id"])
-        return result
-    except Exception as e:
-        logger.error(f"Error fetching result {task_id}: {str(e)}")
-        raise
+        while docs := await asyncio.to_thread(fetch_batch, cursor, TASKS_BATCH_SIZE):
+            for doc in docs:
+                if "_id" in doc and hasattr(doc["_id"], "__str__"):
+                    doc["_id"] = str(doc["_id"])
+                yield doc
+    finally:
+        cursor.close()
+
+
+async def get_task(task_id: str, fields: list[str] | None = None):
+    tasks_collection = get_tasks_collection()
+    result = await asyncio.to_thread(
+        tasks_collection.find_one,
+        {"_id": task_id},
+        projection=build_projection(fields) or TASK_EXCLUDED_FIELDS,
+    )
+    if not result:
+        return {"error": "Task not found"}
+    if "_id" in result and hasattr(result["_id"], "__str__"):
+        result["_id"] = str(result["_id"])
+    return result
 
 
 async def delete_task(task_id: str):
-    try:
-        tasks_collection = get_collection(MONGO_COLLECTION_TASKS)
-        result = tasks_collection.delete_one({"task_id": task_id})
-        if result.deleted_count == 0:
-            return {"error": "Task not found"}
-        return {"status": "deleted", "task_id": task_id}
-    except Exception as e:
-        logger.error(f"Error deleting result {task_id}: {str(e)}")
-        raise
+    tasks_collection = get_tasks_collection()
+    result = await asyncio.to_thread(tasks_collection.delete_one, {"_id": task_id})
+    if result.deleted_count == 0:
+        return {"error": "Task not found"}
+    return {"status": "deleted", "task_id": task_id}
 
 
-def create_indexes():
+def migrate_legacy_task_ids(db):
+    """
+    Rewrite tasks stored with an ObjectId _id so that _id equals task_id,
+    then drop the task_id index that only those tasks needed.
+    Tasks are looked up by _id alone, so this runs before serving requests.
+    """
+    tasks_collection = db[MONGO_COLLECTION_TASKS]
+    # The unique task_id index would reject the copies made below
+    if LEGACY_TASK_ID_INDEX in tasks_collection.index_information():
+        tasks_collection.drop_index(LEGACY_TASK_ID_INDEX)
+        logger.info("Dropped index %s", LEGACY_TASK_ID_INDEX)
+
+    migrated = 0
+    for doc in tasks_collection.find(
+        {"_id": {"$type": "objectId"}, "task_id": {"$exists": True}}
+    ):
+        legacy_id = doc["_id"]
+        try:
+            tasks_collection.insert_one({**doc, "_id": doc["task_id"]})
+        except DuplicateKeyError:
+            # Already copied by an earlier, interrupted run
+            pass
+        tasks_collection.delete_one({"_id": legacy_id})
+        migrated += 1
+
+    if migrated:
+        logger.info("Migrated %d tasks to use task_id as _id", migrated)
+
+
+def create_indexes(db):
+    # Each collection gets its own try so one failure does not skip the rest
+    create_collection_indexes(db, MONGO_COLLECTION_TASKS, create_task_indexes)
+    create_collection_indexes(
+        db, MONGO_COLLECTION_TRANSLATION_CACHE, create_translation_cache_indexes
+    )
+
+
+def create_task_indexes(collection):
+    collection.create_index("created_at")
+    # Only in-flight tasks are indexed, so the index stays small
+    collection.create_index(
+        [("status", 1), ("created_at", -1)],
+        partialFilterExpression={
+            "status": {"$in": [TaskStatus.PENDING.value, TaskStatus.PROCESSING.value]}
+        },
+        name="active_tasks_idx",
+    )
+
+
+def create_translation_cache_indexes(collection):
+    # MongoDB drops cached translations once they are older than the TTL
+    collection.create_index("created_at", expireAfterSeconds=TRANSLATION_CACHE_TTL)
+
+
+def create_collection_indexes(db, collection_name, create):
     try:
-        tasks_collection = get_collection(MONGO_COLLECTION_TASKS)
-        tasks_collection.create_index("task_id", unique=True)
-        tasks_collection.create_index("created_at")
-        logger.info(f"Indexes created for collection: {MONGO_COLLECTION_TASKS}")
+        create(db[collection_name])
+        logger.info("Indexes created for collection: %s", collection_name)
     except OperationFailure as e:
         logger.error(
-            f"Error creating indexes (OperationFailure): {str(e)}, full error: {e.details}"
+            "Error creating indexes for %s (OperationFailure): %s, full error: %s",
+            collection_name,
+            e,
+            e.details,
         )
     except Exception as e:
-        logger.error(f"Unexpected error creating indexes: {str(e)}")
+        logger.error("Unexpected error creating indexes for %s: %s", collection_name, e)
 
 
 def initialize_database() -> bool:
     try:
         db = get_database()
 
-        # Ensure Task Status collection exists
-        if MONGO_COLLECTION_TASKS not in db.list_collection_names():
-            db.create_collection(MONGO_COLLECTION_TASKS)
-            logger.info(f"Created collection: {MONGO_COLLECTION_TASKS}")
+        # Test connection (also opens the pool before the first request)
+        db.command("ping")
+        logger.info("Database connection successful.")
 
-        create_indexes()
+        try:
+            migrate_legacy_task_ids(db)
+        except PyMongoError as e:
+            # Index creation below still runs; the migration retries next start
+            logger.error("Task migration error: %s", e)
 
-        # Test connection
-        client = get_mongo_client()
-        client.admin.command("ping")
-        logger.info("Database connection successful.")
+        # create_index implicitly creates the collection when it is missing
+        create_indexes(db)
         return True
     except Exception as e:
-        logger.error(f"Database initialization error: {str(e)}")
+        logger.error("Database initialization error: %s", e)
         return False
@@ -1,51 +1,69 @@
+import asyncio
+
+import aio_pika
+
+from service.cache import ttl_cache
 from service.db import MONGO_DB, get_mongo_client
 from service.llm import get_ollama_client
 from service.log import logger
-from service.mq import get_rabbitmq_client
+from service.mq import get_rabbitmq_connection_params
 from service.storage import DEFAULT_BUCKET, get_minio_client
 
+# Dashboards poll these endpoints; reuse results to spare the upstreams
+HEALTH_CHECK_TTL = 5
+# Seconds a probe may take before the dependency is reported as down
+HEALTH_CHECK_TIMEOUT = 2
+
 
 async def health_check_backend():
     return {"status": "ok"}
 
 
+@ttl_cache(ttl=HEALTH_CHECK_TTL)
 async def health_check_ollama():
     try:
-        client = get_ollama_client()
-        client.ps()
+        async with asyncio.timeout(HEALTH_CHECK_TIMEOUT):
+            client = get_ollama_client()
+            await client.ps()
         return {"status": "ok"}
     except Exception as e:
-        logger.error(f"Ollama health check failed: {str(e)}")
-        return {"status": "error", "error": str(e)}
+        logger.error("Ollama health check failed: %s", e)
+        return {"status": "error", "error": str(e) or type(e).__name__}
 
 
+@ttl_cache(ttl=HEALTH_CHECK_TTL)
 async def health_check_db():
     try:
-        client = get_mongo_client()
-        db = client[MONGO_DB]
-        db.list_collection_names()
+        async with asyncio.timeout(HEALTH_CHECK_TIMEOUT):
+            client = get_mongo_client()
+            db = client[MONGO_DB]
+            await asyncio.to_thread(db.list_collection_names)
         return {"status": "ok"}
     except Exception as e:
-        logger.error(f"Database health check failed: {str(e)}")
-        return {"status": "error", "error": str(e)}
+        logger.error("Database health check failed: %s", e)
+        return {"status": "error", "error": str(e) or type(e).__name__}
 
 
+@ttl_cache(ttl=HEALTH_CHECK_TTL)
 async def health_check_mq():
     try:
-        connection = get_rabbitmq_client()
-        connection.channel()
-        connection.close()
+        async with asyncio.timeout(HEALTH_CHECK_TIMEOUT):
+            connection = await aio_pika.connect(**get_rabbitmq_connection_params())
+            async with connection:
+                await connection.channel()
         return {"status": "ok"}
     except Exception as e:
-        logger.error(f"Message queue health check failed: {str(e)}")
-        return {"status": "error", "error": str(e)}
+        logger.error("Message queue health check failed: %s", e)
+        return {"status": "error", "error": str(e) or type(e).__name__}
 
 
+@ttl_cache(ttl=HEALTH_CHECK_TTL)
 async def health_check_storage():
     try:
-        client = get_minio_client()
-        client.bucket_exists(DEFAULT_BUCKET)
+        async with asyncio.timeout(HEALTH_CHECK_TIMEOUT):
+            client = get_minio_client()
+            await asyncio.to_thread(client.bucket_exists, DEFAULT_BUCKET)
         return {"status": "ok"}
     except Exception as e:
-        logger.error(f"Storage health check failed: {str(e)}")
-        return {"status": "error", "error": str(e)}
+        logger.error("Storage health check failed: %s", e)
+        return {"status": "error", "error": str(e) or type(e).__name__}
@@ -1,23 +1,57 @@
-import requests
-from litellm import NotFoundError, completion
-from ollama import Client
+import asyncio
 
+import httpx
+from litellm import NotFoundError, acompletion
+from ollama import AsyncClient
+
+from service.cache import ttl_cache
 from service.log import logger
 
 OLLAMA_HOST_URL = "http://ollama:11434"
+MODELS_API_URL = "https://llm-models-api.yashikota.workers.dev/models"
+
+# Shared HTTP client so model catalog requests reuse keep-alive connections
+_http_client = httpx.AsyncClient(
+    timeout=10.0,
+    limits=httpx.Limits(max_connections=20),
+)
+
+
+# Shared async client so requests reuse its HTTP connection pool
+# without blocking the event loop
+_ollama_client: AsyncClient | None = None
+
 
+def get_ollama_client() -> AsyncClient:
+    global _ollama_client
+    if _ollama_client is None:
+        _ollama_client = AsyncClient(host=OLLAMA_HOST_URL)
+    return _ollama_client
 
-def get_ollama_client() -> Client:
-    return Client(host=OLLAMA_HOST_URL)
 
+def is_complete_catalog(models) -> bool:
+    # Failed lookups come back as error strings; those are retried next call
+    return isinstance(models, dict) and all(
+        isinstance(provider_models, list) for provider_models in models.values()
+    )
 
+
+@ttl_cache(ttl=60, cache_if=is_complete_catalog)
 async def get_models():
     try:
-        ollama_models = await get_ollama_models()
-        openai_models = await get_openapi_models()
-        anthropic_models = await get_anthropic_models()
-        google_models = await get_google_models()
-        deepseek_models = await get_deepseek_models()
+        (
+            ollama_models,
+            openai_models,
+            anthropic_models,
+            google_models,
+            deepseek_models,
+        ) = await asyncio.gather(
+            get_ollama_models(),
+            get_openapi_models(),
+            get_anthropic_models(),
+            get_google_models(),
+            get_deepseek_models(),
+        )
         return {
             "ollama": ollama_models,
             "openai": openai_models,
@@ -29,18 +63,24 @@ async def get_models():
         return str(e)
 
 
+async def fetch_json(url: str) -> dict:
+    response = await _http_client.get(url)
+    return response.json()
+
+
 async def get_ollama_models():
     try:
         client = get_ollama_client()
-        return [model["name"] for model in client.list().get("models", [])]
+        models = await client.list()
+        return [model["name"] for model in models.get("models", [])]
     except Exception as e:
         return str(e)
 
 
 async def get_openapi_models():
     try:
-        url = "https://llm-models-api.yashikota.workers.dev/models?provider=openai"
-        res = requests.get(url).json()
+        url = f"{MODELS_API_URL}?provider=openai"
+        res = await fetch_json(url)
         return [model["id"].split("/")[1] for model in res.get("data", [])]
     except Exception as e:
         return str(e)
@@ -48,8 +88,8 @@ async def get_openapi_models():
 
 async def get_anthropic_models():
     try:
-        url = "https://llm-models-api.yashikota.workers.dev/models?provider=anthropic"
-        res = requests.get(url).json()
+        url = f"{MODELS_API_URL}?provider=anthropic"
+        res = await fetch_json(url)
         return [model["id"].split("/")[1] for model in res.get("data", [])]
     except Exception as e:
         return str(e)
@@ -57,8 +97,8 @@ async def get_anthropic_models():
 
 async def get_google_models():
     try:
-        url = "https://llm-models-api.yashikota.workers.dev/models?provider=google&strip_suffix=true"
-        res = requests.get(url).json()
+        url = f"{MODELS_API_URL}?provider=google&strip_suffix=true"
+        res = await fetch_json(url)
         return [
             model["id"].split("/")[1]
             for model in res.get("data", [])
@@ -70,8 +110,8 @@ async def get_google_models():
 
 async def get_deepseek_models():
     try:
-        url = "https://llm-models-api.yashikota.workers.dev/models?provider=deepseek&ignore_free=true"
-        res = requests.get(url).json()
+        url = f"{MODELS_API_URL}?provider=deepseek&ignore_free=true"
+        res = await fetch_json(url)
         return [model["id"].split("/")[1] for model in res.get("data", [])]
     except Exception as e:
         return str(e)
@@ -87,12 +127,12 @@ def get_api_params(provider: str, api_key: str) -> dict:
 async def check_valid_model(provider, model, api_key: str) -> bool:
     try:
         api_params = get_api_params(provider, api_key)
-        response = completion(
+        response = await acompletion(
             model=f"{convert_model(provider, model)}",
             messages=[{"role": "user", "content": "あなたは誰？"}],
             **api_params,
         )
-        logger.info(f"Model check response: {response}")
+        logger.info("Model check response: %s", response)
         return True
     except NotFoundError:
         return False
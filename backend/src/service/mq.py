@@ -1,21 +1,22 @@
 import asyncio
+import functools
 import json
 import os
-from enum import Enum
+from datetime import datetime
 
-import pika
+import aio_pika
 from bson import ObjectId
-from pika.adapters.asyncio_connection import AsyncioConnection
 
 from service.log import logger
 
 
-# Custom JSON encoder for MongoDB ObjectId
-class MongoJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        return super().default(obj)
+# JSON fallback for MongoDB ObjectId and BSON dates
+def json_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
 # RabbitMQ configuration
@@ -27,122 +28,92 @@ RABBITMQ_VHOST = os.getenv("RABBITMQ_VHOST", "/")
 
 # Queue names
 TRANSLATION_QUEUE = "translation_requests"
-TASK_UPDATE_QUEUE = "task_updates"
 
-
-class TaskStatus(Enum):
-    PENDING = "pending"
-    PROCESSING = "processing"
-    COMPLETED = "completed"
-    FAILED = "failed"
-
-
-def get_rabbitmq_connection_params() -> pika.ConnectionParameters:
-    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-    return pika.ConnectionParameters(
-        host=RABBITMQ_HOST,
-        port=RABBITMQ_PORT,
-        virtual_host=RABBITMQ_VHOST,
-        credentials=credentials,
-        heartbeat=600,
-        blocked_connection_timeout=300,
-    )
-
-
-def get_rabbitmq_client():
-    return pika.BlockingConnection(get_rabbitmq_connection_params())
-
-
-async def get_rabbitmq_connection():
-    future = asyncio.Future()
-
-    def on_open(connection):
-        if not future.done():
-            future.set_result(connection)
-
-    def on_error(connection, error):
-        if not future.done():
-            future.set_exception(Exception(f"Failed to connect to RabbitMQ: {error}"))
-
-    AsyncioConnection(
-        get_rabbitmq_connection_params(),
-        on_open_callback=on_open,
-        on_open_error_callback=on_error,
+# Properties shared by every published message
+PERSISTENT_JSON_PROPERTIES = {
+    "delivery_mode": aio_pika.DeliveryMode.PERSISTENT,
+    "content_type": "application/json",
+}
+
+
+# Built once; the settings are fixed for the life of the process
+@functools.cache
+def get_rabbitmq_connection_params() -> dict:
+    return {
+        "host": RABBITMQ_HOST,
+        "port": RABBITMQ_PORT,
+        "login": RABBITMQ_USER,
+        "password": RABBITMQ_PASS,
+        "virtualhost": RABBITMQ_VHOST,
+        # Passed through to the AMQP URL; long translations must not drop it
+        "heartbeat": 600,
+    }
+
+
+async def get_rabbitmq_connection() -> aio_pika.abc.AbstractRobustConnection:
+    return await aio_pika.connect_robust(**get_rabbitmq_connection_params())
+
+
+# Long-lived publisher connection shared by every publish call
+_publisher_connection: aio_pika.abc.AbstractRobustConnection | None = None
+_publisher_channel: aio_pika.abc.AbstractChannel | None = None
+_publisher_lock = asyncio.Lock()
+
+
+async def get_publisher_channel() -> aio_pika.abc.AbstractChannel:
+    """
+    Return the shared publisher channel, (re)opening it if needed.
+    The robust connection reconnects by itself after broker restarts.
+    """
+    global _publisher_connection, _publisher_channel
+    async with _publisher_lock:
+        if _publisher_connection is None or _publisher_connection.is_closed:
+            _publisher_connection = await get_rabbitmq_connection()
+            _publisher_channel = None
+        if _publisher_channel is None or _publisher_channel.is_closed:
+            _publisher_channel = await _publisher_connection.channel(
+                publisher_confirms=True
+            )
+    return _publisher_channel
+
+
+async def publish_message(queue_name: str, data: dict) -> None:
+    channel = await get_publisher_channel()
+    await channel.default_exchange.publish(
+        aio_pika.Message(
+            body=json.dumps(data, default=json_default, separators=(",", ":")).encode(),
+            **PERSISTENT_JSON_PROPERTIES,
+        ),
+        routing_key=queue_name,
     )
 
-    return await future
-
-
-def ensure_queue_exists(channel, queue_name: str) -> None:
-    channel.queue_declare(queue=queue_name, durable=True)
-
 
 async def publish_task(task_data):
     try:
-        connection = get_rabbitmq_client()
-        channel = connection.channel()
-        ensure_queue_exists(channel, TRANSLATION_QUEUE)
-
-        channel.basic_publish(
-            exchange="",
-            routing_key=TRANSLATION_QUEUE,
-            body=json.dumps(task_data, cls=MongoJSONEncoder),
-            properties=pika.BasicProperties(
-                delivery_mode=2,
-                content_type="application/json",
-            ),
-        )
-        connection.close()
-        logger.info(f"Task {task_data.get('task_id')} published to queue")
+        await publish_message(TRANSLATION_QUEUE, task_data)
+        logger.info("Task %s published to queue", task_data.get("task_id"))
         return True
     except Exception as e:
-        logger.error(f"Failed to publish task to queue: {str(e)}")
-        return False
-
-
-async def publish_task_update(task_id, status, message=None):
-    try:
-        update_data = {
-            "task_id": task_id,
-            "status": status,
-        }
-        if message:
-            update_data["message"] = message
-
-        connection = get_rabbitmq_client()
-        channel = connection.channel()
-
-        ensure_queue_exists(channel, TASK_UPDATE_QUEUE)
-
-        channel.basic_publish(
-            exchange="",
-            routing_key=TASK_UPDATE_QUEUE,
-            body=json.dumps(update_data, cls=MongoJSONEncoder),
-            properties=pika.BasicProperties(
-                delivery_mode=2,
-                content_type="application/json",
-            ),
-        )
-
-        connection.close()
-        logger.info(f"Task update published for {task_id}: {status}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to publish task update: {str(e)}")
+        logger.error("Failed to publish task to queue: %s", e)
         return False
 
 
 async def initialize_mq() -> bool:
     try:
-        connection = get_rabbitmq_client()
-        channel = connection.channel()
-
-        ensure_queue_exists(channel, TRANSLATION_QUEUE)
-        ensure_queue_exists(channel, TASK_UPDATE_QUEUE)
+        # Queues are declared once here instead of on every publish
+        channel = await get_publisher_channel()
+        await channel.declare_queue(TRANSLATION_QUEUE, durable=True)
 
-        connection.close()
         logger.info("Translation service initialized successfully")
         return True
     except Exception as e:
-        logger.error(f"Failed to initialize translation service: {str(e)}")
+        logger.error("Failed to initialize translation service: %s", e)
         return False
+
+
+async def close_mq() -> None:
+    global _publisher_connection, _publisher_channel
+    if _publisher_connection is not None and not _publisher_connection.is_closed:
+        await _publisher_connection.close()
+    _publisher_connection = None
+    _publisher_channel = None
@@ -0,0 +1,123 @@
+import asyncio
+import math
+import os
+import pickle
+import sys
+import tempfile
+
+import fitz  # PyMuPDF
+
+# Large PDFs are split into page ranges extracted in separate processes.
+# Each process runs this module only, so it imports PyMuPDF and nothing else.
+PDF_EXTRACT_WORKERS = min(os.cpu_count() or 1, 6)
+PDF_EXTRACT_MIN_PAGES = 8
+
+
+def extract_page_blocks(document, start, stop):
+    """
+    開いたPDFの指定ページ範囲からテキストブロックを抽出します。
+    """
+    content = []
+    for page_num in range(start, stop):
+        # ページを取得
+        page = document.load_page(page_num)
+        # ページからテキストブロックを取得
+        text_instances = page.get_text("dict")["blocks"]
+        page_content = []
+
+        for lines in text_instances:
+            block = {}
+            if lines["type"] != 0:
+                # テキストブロック以外はスキップ
+                continue
+            block["page_no"] = page_num
+            block["block_no"] = lines["number"]
+            block["coordinates"] = lines["bbox"]
+            block["text"] = ""
+            # フォントサイズの平均は合計と個数から求める
+            size_total = 0.0
+            size_count = 0
+            for line in lines["lines"]:
+                for span in line["spans"]:
+                    if block["text"] == "":
+                        block["text"] += span["text"]
+                    else:
+                        block["text"] += " " + span["text"]
+                    size_total += span["size"]
+                    size_count += 1
+                    block["font"] = span["font"]
+            block["size"] = size_total / size_count if size_count else 0.0
+            page_content.append(block)
+
+        content.append(page_content)
+    return content
+
+
+async def extract_page_blocks_in_subprocess(pdf_path, start, stop):
+    """
+    別プロセスでPDFファイルの指定ページ範囲を抽出します。
+    子プロセスにはファイルパスとページ範囲だけを渡します。
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "service.pdf_extract",
+        pdf_path,
+        str(start),
+        str(stop),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # キャンセル時も子プロセスを残さない
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"page extraction failed for pages {start}-{stop}: "
+            f"{stderr.decode(errors='replace').strip()}"
+        )
+    return pickle.loads(stdout)
+
+
+async def extract_text_blocks(pdf_data):
+    """
+    pdfバイトデータの全ページからテキストブロックを抽出します。
+    ページ数が多い場合はページ範囲ごとに別プロセスで並列に抽出します。
+    """
+    document = await asyncio.to_thread(fitz.open, stream=pdf_data, filetype="pdf")
+    with document:
+        page_count = len(document)
+        if page_count < PDF_EXTRACT_MIN_PAGES or PDF_EXTRACT_WORKERS == 1:
+            return await asyncio.to_thread(extract_page_blocks, document, 0, page_count)
+
+    # PDF全体を各プロセスに渡さず、一時ファイルに1回だけ書き出す
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        await asyncio.to_thread(pdf_file.write, pdf_data)
+        await asyncio.to_thread(pdf_file.flush)
+
+        # 1つでも失敗したら残りの抽出はキャンセルされる
+        chunk_size = math.ceil(page_count / PDF_EXTRACT_WORKERS)
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(
+                    extract_page_blocks_in_subprocess(
+                        pdf_file.name, start, min(start + chunk_size, page_count)
+                    )
+                )
+                for start in range(0, page_count, chunk_size)
+            ]
+    return [page_content for task in tasks for page_content in task.result()]
+
+
+if __name__ == "__main__":
+    # Child process entry point: extract one page range and pickle it to stdout
+    path, start, stop = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+    with fitz.open(path) as document:
+        blocks = extract_page_blocks(document, start, stop)
+    sys.stdout.buffer.write(pickle.dumps(blocks))
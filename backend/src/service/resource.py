@@ -1,13 +1,19 @@
+import functools
 import time
 
 import psutil
 
 from service.log import logger
 
+# Seconds a snapshot is reused so bursty polls don't each fork nvidia-smi
+SYSTEM_INFO_TTL = 0.2
+
 
 class SystemMonitor:
     def __init__(self):
         self.has_gpu = self._check_gpu_availability()
+        self._cached_info = None
+        self._cached_at = 0.0
 
     def _check_gpu_availability(self):
         try:
@@ -16,16 +22,28 @@ class SystemMonitor:
             subprocess.check_output(["nvidia-smi"])
             return True
         except Exception as e:
-            logger.warning(f"No GPU detected: {str(e)}")
+            logger.warning("No GPU detected: %s", e)
             return False
 
     def get_system_info(self):
         """システムリソース情報の取得"""
+        now = time.monotonic()
+        if self._cached_info is not None and now - self._cached_at < SYSTEM_INFO_TTL:
+            return self._cached_info
+
+        info = self._collect_system_info()
+        self._cached_info = info
+        self._cached_at = now
+        return info
+
+    def _collect_system_info(self):
+        # One /proc/stat read; the total is the mean of the per-CPU values
+        per_cpu = psutil.cpu_percent(interval=None, percpu=True)
         info = {
             "timestamp": time.time(),
             "cpu": {
-                "total": psutil.cpu_percent(interval=None),
-                "per_cpu": psutil.cpu_percent(interval=None, percpu=True),
+                "total": round(sum(per_cpu) / len(per_cpu), 1) if per_cpu else 0.0,
+                "per_cpu": per_cpu,
                 "memory": psutil.virtual_memory().percent,
             },
         }
@@ -44,6 +62,12 @@ class SystemMonitor:
                     "memory_total": float(mem_total),
                 }
             except Exception as e:
-                logger.error(f"GPU info error: {str(e)}")
+                logger.error("GPU info error: %s", e)
 
         return info
+
+
+# Shared monitor so the GPU probe runs once and CPU deltas span between polls
+@functools.cache
+def get_system_monitor() -> SystemMonitor:
+    return SystemMonitor()
@@ -1,8 +1,14 @@
+import asyncio
+import io
 import json
 import os
-import tempfile
+import threading
 
 import minio
+from minio.commonconfig import ENABLED, CopySource, Filter
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
 
 from service.log import logger
 
@@ -12,14 +18,36 @@ MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "root")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
 DEFAULT_BUCKET = os.getenv("MINIO_DEFAULT_BUCKET", "leadable")
 
+# Public base URL for stored objects
+SERVER_ADDRESS = os.getenv("SERVER_ADDRESS")
+FILE_URL_PREFIX = f"http://{SERVER_ADDRESS}:9000/{DEFAULT_BUCKET}/"
+
+# Finished translations keyed by the source PDF hash (see service.worker)
+PDF_CACHE_PREFIX = "pdf-cache/"
+# Days before MinIO deletes a cached translated PDF
+PDF_CACHE_EXPIRY_DAYS = int(os.getenv("PDF_CACHE_EXPIRY_DAYS", "30"))
+PDF_CACHE_LIFECYCLE_RULE_ID = "pdf-cache-expiry"
+
+
+# Shared client so requests reuse its HTTP connection pool
+_client: minio.Minio | None = None
+_client_lock = threading.Lock()
+
 
 def get_minio_client() -> minio.Minio:
-    return minio.Minio(
-        endpoint=MINIO_ENDPOINT,
-        access_key=MINIO_ACCESS_KEY,
-        secret_key=MINIO_SECRET_KEY,
-        secure=False,
-    )
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            _client = minio.Minio(
+                endpoint=MINIO_ENDPOINT,
+                access_key=MINIO_ACCESS_KEY,
+                secret_key=MINIO_SECRET_KEY,
+                secure=False,
+            )
+    return _client
 
 
 def initialize_storage() -> bool:
@@ -44,68 +72,138 @@ def initialize_storage() -> bool:
             ],
         }
         client.set_bucket_policy(DEFAULT_BUCKET, json.dumps(policy))
-        logger.info(f"Applied bucket policy to {DEFAULT_BUCKET}")
+        logger.info("Applied bucket policy to %s", DEFAULT_BUCKET)
+
+        # Let MinIO expire cached translations instead of keeping them forever
+        apply_pdf_cache_lifecycle(client)
+        logger.info("Applied lifecycle rule to %s", DEFAULT_BUCKET)
         return True
     except Exception as e:
-        logger.error(f"Error initializing storage: {str(e)}")
+        logger.error("Error initializing storage: %s", e)
         return False
 
 
+def apply_pdf_cache_lifecycle(client: minio.Minio) -> None:
+    """
+    Add or replace the pdf-cache expiry rule, keeping any other lifecycle
+    rules configured on the bucket.
+    """
+    current = client.get_bucket_lifecycle(DEFAULT_BUCKET)
+    rules = [
+        rule
+        for rule in (current.rules if current else [])
+        if rule.rule_id != PDF_CACHE_LIFECYCLE_RULE_ID
+    ]
+    rules.append(
+        Rule(
+            ENABLED,
+            rule_filter=Filter(prefix=PDF_CACHE_PREFIX),
+            rule_id=PDF_CACHE_LIFECYCLE_RULE_ID,
+            expiration=Expiration(days=PDF_CACHE_EXPIRY_DAYS),
+        )
+    )
+    client.set_bucket_lifecycle(DEFAULT_BUCKET, LifecycleConfig(rules))
+
+
 def ensure_bucket_exists(client: minio.Minio, bucket_name: str) -> None:
     try:
         if not client.bucket_exists(bucket_name):
             client.make_bucket(bucket_name)
-            logger.info(f"Created bucket: {bucket_name}")
+            logger.info("Created bucket: %s", bucket_name)
     except Exception as e:
-        logger.error(f"Error ensuring bucket exists: {str(e)}")
+        logger.error("Error ensuring bucket exists: %s", e)
         raise
 
 
 async def upload_file(file: bytes, filename: str, filetype: str) -> bool:
     try:
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(file)
-
-        try:
-            client = get_minio_client()
-            ensure_bucket_exists(client, DEFAULT_BUCKET)
-            client.fput_object(
-                bucket_name=DEFAULT_BUCKET,
-                object_name=filename,
-                file_path=temp_file.name,
-                content_type=filetype,
-            )
-            return True
-        except Exception as e:
-            logger.error(f"MinIO upload error: {str(e)}")
-            return False
-        finally:
-            os.unlink(temp_file.name)
+        client = get_minio_client()
+        # The MinIO SDK is blocking, so keep it off the event loop
+        await asyncio.to_thread(ensure_bucket_exists, client, DEFAULT_BUCKET)
+        # Stream straight from memory instead of round-tripping through a temp file
+        await asyncio.to_thread(
+            client.put_object,
+            bucket_name=DEFAULT_BUCKET,
+            object_name=filename,
+            data=io.BytesIO(file),
+            length=len(file),
+            content_type=filetype,
+        )
+        return True
     except Exception as e:
-        logger.error(f"Error writing file to disk: {str(e)}")
+        logger.error("MinIO upload error: %s", e)
         return False
 
 
-def get_file_url(filename: str) -> str:
-    ADDRESS = os.getenv("SERVER_ADDRESS")
-    return f"http://{ADDRESS}:9000/{DEFAULT_BUCKET}/{filename}"
+async def file_exists(filename: str) -> bool:
+    try:
+        client = get_minio_client()
+        await asyncio.to_thread(
+            client.stat_object, bucket_name=DEFAULT_BUCKET, object_name=filename
+        )
+        return True
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            logger.error("Error checking file %s: %s", filename, e)
+        return False
+    except Exception as e:
+        logger.error("Error checking file %s: %s", filename, e)
+        return False
 
 
-async def download_file(filename: str) -> bytes:
+async def copy_file(source: str, destination: str) -> bool:
+    """
+    Copy an object within the bucket on the server side.
+    """
     try:
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_path = temp_file.name
-
         client = get_minio_client()
-        client.fget_object(
-            bucket_name=DEFAULT_BUCKET, object_name=filename, file_path=temp_path
+        await asyncio.to_thread(
+            client.copy_object,
+            bucket_name=DEFAULT_BUCKET,
+            object_name=destination,
+            source=CopySource(DEFAULT_BUCKET, source),
         )
+        return True
+    except Exception as e:
+        logger.error("Error copying file %s to %s: %s", source, destination, e)
+        return False
+
 
-        with open(temp_path, "rb") as file:
-            data = file.read()
+def delete_files_with_prefix(prefix: str) -> int:
+    """
+    Delete every object under `prefix` and return how many were deleted.
+    """
+    client = get_minio_client()
+    names = [
+        obj.object_name
+        for obj in client.list_objects(DEFAULT_BUCKET, prefix=prefix, recursive=True)
+    ]
+    # remove_objects is lazy; iterating it performs the deletes
+    errors = list(
+        client.remove_objects(DEFAULT_BUCKET, [DeleteObject(name) for name in names])
+    )
+    for error in errors:
+        logger.error("Error deleting file %s: %s", error.name, error.message)
+    return len(names) - len(errors)
+
+
+def get_file_url(filename: str) -> str:
+    return FILE_URL_PREFIX + filename
 
-        os.unlink(temp_path)
-        return data
+
+async def download_file(filename: str) -> bytes:
+    response = None
+    try:
+        client = get_minio_client()
+        response = await asyncio.to_thread(
+            client.get_object, bucket_name=DEFAULT_BUCKET, object_name=filename
+        )
+        return await asyncio.to_thread(response.read)
     except Exception as e:
-        logger.error(f"Error downloading file {filename}: {str(e)}")
+        logger.error("Error downloading file %s: %s", filename, e)
         raise
+    finally:
+        # Hand the connection back to the client's pool
+        if response is not None:
+            response.close()
+            response.release_conn()
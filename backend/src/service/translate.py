@@ -1,26 +1,267 @@
 import asyncio
-import copy
+import functools
 import math
+import os
 import re
 import string
+import time
 from collections import defaultdict
 from io import BytesIO
-from textwrap import dedent
 
 import fitz  # PyMuPDF
 import numpy as np
 import spacy
-from litellm import completion
-from tenacity import retry, stop_after_attempt, wait_fixed
+from litellm import (
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+    ServiceUnavailableError,
+    Timeout,
+    acompletion,
+)
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter
 
 from service.db import TaskStatus
 from service.llm import convert_model, get_api_params
 from service.log import logger
+from service.pdf_extract import extract_text_blocks
+from service.translate_cache import (
+    get_cached_translations,
+    make_cache_key,
+    store_translations,
+)
+
+# Texts handed to spaCy per nlp.pipe batch
+SPACY_BATCH_SIZE = 256
+# Deletes ASCII punctuation and digits in a single str.translate pass
+SPECIAL_CHARS_TABLE = str.maketrans("", "", string.punctuation + string.digits)
+# Only the tokenizer is used (token.text / token.is_alpha), so the
+# statistical components are not loaded at all
+SPACY_EXCLUDED_COMPONENTS = [
+    "tok2vec",
+    "tagger",
+    "morphologizer",
+    "parser",
+    "senter",
+    "attribute_ruler",
+    "lemmatizer",
+    "ner",
+]
+
+
+# Adjacent blocks sent to the LLM together as one numbered list
+TRANSLATION_BATCH_MAX_BLOCKS = 16
+TRANSLATION_BATCH_MAX_CHARS = 4000
+NUMBERED_LINE_PATTERN = re.compile(r"^\s*(\d+)\.\s*", re.MULTILINE)
+# Blocks left as they are instead of being sent to the LLM: blank, numbers
+# and symbols only, URLs, email addresses, bare figure/table labels and
+# ASCII tokens shorter than 4 characters
+UNTRANSLATABLE_TEXT_PATTERN = re.compile(
+    r"[\s\d\W]*"
+    r"|https?://\S+"
+    r"|\S+@\S+\.\S+"
+    r"|(?:Fig\.?|Figure|Table)\s*\d+\.?"
+    r"|(?a:\w{1,3})",
+    re.IGNORECASE,
+)
+# Translation replies are streamed and aborted past this multiple of the
+# source length (with a floor for very short blocks)
+MAX_OUTPUT_LENGTH_RATIO = 4
+MIN_TRANSLATION_OUTPUT_CHARS = 256
+
+# Merged blocks are flushed once their text reaches this many characters,
+# even without a sentence-end marker
+TRANSLATION_TARGET_CHARS = int(os.getenv("TRANSLATION_TARGET_CHARS", "1500"))
+
+# Upper bound on in-flight LLM requests across all tasks in this process
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", "16"))
+_llm_semaphore = asyncio.Semaphore(TRANSLATION_CONCURRENCY)
+# Errors that mean the provider is overloaded or unreachable; one of them
+# pauses all requests to that provider instead of letting retries pile up
+LLM_OVERLOAD_ERRORS = (
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+    ServiceUnavailableError,
+    Timeout,
+)
+LLM_OVERLOAD_PAUSE = 5
+
+# Font size search range when translated text has to shrink to fit its box
+MIN_WRITE_FONT_SIZE = 1.0
+FONT_SIZE_SEARCH_STEP = 0.1
+
+# spaCy pipelines kept in memory; the least recently used one is dropped first
+SPACY_MAX_LOADED_MODELS = int(os.getenv("SPACY_MAX_LOADED_MODELS", "2"))
+
+
+@functools.lru_cache(maxsize=SPACY_MAX_LOADED_MODELS)
+def load_spacy_model(model_name):
+    # Failed loads raise and are therefore not cached
+    return spacy.load(model_name, exclude=SPACY_EXCLUDED_COMPONENTS)
+
+
+class TokenBucket:
+    """
+    Allow `rate` acquisitions per second with bursts of up to `capacity`.
+    Waiting callers sleep instead of blocking the event loop.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_rate_limiters: dict[str, TokenBucket | None] = {}
+# Cleared while a provider is overloaded so every pending request waits
+_provider_available: dict[str, asyncio.Event] = {}
+
+
+def get_rate_limiter(provider):
+    """
+    Return the shared request rate limiter for a provider, or None if unlimited.
+    Set LLM_RATE_LIMIT_<PROVIDER> (requests per second), e.g. LLM_RATE_LIMIT_GOOGLE=2.
+    """
+    if provider not in _rate_limiters:
+        rate = os.getenv(f"LLM_RATE_LIMIT_{str(provider).upper()}")
+        _rate_limiters[provider] = (
+            TokenBucket(float(rate), max(1.0, float(rate))) if rate else None
+        )
+    return _rate_limiters[provider]
+
+
+def preprocess_text(text: str) -> str:
+    """
+    Strip surrounding newlines, collapse runs of blank lines into one and
+    remove the common indentation, in a single pass over the lines.
+    Gives the same result as a newline-collapsing re.sub followed by dedent.
+    """
+    lines = []
+    margin = None
+    previous_empty = False
+    for line in text.strip("\n").split("\n"):
+        if line == "":
+            if not previous_empty:
+                lines.append(line)
+            previous_empty = True
+            continue
+        previous_empty = False
+        content = line.lstrip(" \t")
+        if content == "":
+            # Whitespace-only lines become empty and do not affect the margin
+            lines.append("")
+            continue
+        indent = line[: len(line) - len(content)]
+        margin = indent if margin is None else os.path.commonprefix([margin, indent])
+        lines.append(line)
+
+    # Plain paragraphs have no indentation, so there is nothing to remove
+    if margin:
+        cut = len(margin)
+        lines = [line[cut:] for line in lines]
+    return "\n".join(lines)
+
+
+# Prompts are normalised once at import; only the inserted text varies per call
+TRANSLATION_SYSTEM_PROMPT = (
+    "You are a world-class translator and will translate English text to Japanese."
+)
+TRANSLATION_PROMPT_TEMPLATE = preprocess_text(
+    """
+    This is a English to Japanese, Literal Translation task.
+    Please provide the Japanese translation for the next sentences.
+    You must not include any chat messages to the user in your response.
+    ---
+    {original_text}
+    """
+)
+BATCH_TRANSLATION_PROMPT_TEMPLATE = preprocess_text(
+    """
+    This is a English to Japanese, Literal Translation task.
+    Each numbered line below is a separate passage. Translate every passage into Japanese.
+    Answer with one "<number>. <translation>" line per passage, keeping the same numbers and order.
+    You must not include any chat messages to the user in your response.
+    ---
+    {numbered_text}
+    """
+)
+REVIEW_PROMPT_TEMPLATE = preprocess_text(
+    """
+    Orginal Text(English):
+    {original_text}
+    ---
+    Translated Text(Japanese):
+    {translated_text}
+    ---
+    Is there anything in the above Translated Text that does not conform to the local language's grammar, style, natural tone or cultural norms?
+    Find mistakes and specify corrected phrase and why it is not appropriate.
+    Each bullet should be in the following format:
+
+    * <translated_phrase>
+        * Corrected: <corrected_phrase>
+        * Why: <reason>
+    """
+)
+REFINE_PROMPT_TEMPLATE = preprocess_text(
+    """
+    Orginal Text:
+    {original_text}
+    ---
+    Hints for translation:
+    {review_comments}
+    ---
+    Read the Original Text, and Hits for trasnlation above, then provide complete and accurate Japanese translation.
+    You must not include any chat messages to the user in your response.
+    """
+)
+
+
+def get_provider_available(provider) -> asyncio.Event:
+    if provider not in _provider_available:
+        event = asyncio.Event()
+        event.set()
+        _provider_available[provider] = event
+    return _provider_available[provider]
+
+
+def max_translation_chars(text):
+    """
+    翻訳の応答として許容する最大文字数を返します。
+    これを超える応答は前置きや繰り返しの暴走とみなして打ち切ります。
+    """
+    return max(MIN_TRANSLATION_OUTPUT_CHARS, len(text) * MAX_OUTPUT_LENGTH_RATIO)
+
+
+def split_numbered_texts(text, count):
+    """
+    "1. ...\n2. ..." 形式の応答を項目ごとのリストに分割します。
+    1からcountまでの番号が順に揃っていない場合はNoneを返します。
+    """
+    parts = NUMBERED_LINE_PATTERN.split(text)
+    numbers = [int(number) for number in parts[1::2]]
+    if numbers != list(range(1, count + 1)):
+        return None
+    return [item.strip() for item in parts[2::2]]
 
 
 class TranslationService:
     supported_languages = {"en": "en_core_web_sm", "ja": "ja_core_news_sm"}
-    loaded_models = {}
 
     def __init__(self):
         self.task_id = ""
@@ -35,6 +276,8 @@ class TranslationService:
         self.provider = ""
         self.model_name = ""
         self.api_key = ""
+        # False skips cache lookups; new translations are still stored
+        self.use_cache = True
 
         # Progress tracking
         self.length = 0
@@ -51,21 +294,22 @@ class TranslationService:
 
     def load_model(self, lang_code):
         """指定された言語コードのモデルをロードする"""
-        if lang_code in self.loaded_models:
-            return self.loaded_models[lang_code]
         if lang_code in self.supported_languages:
             model_name = self.supported_languages[lang_code]
             try:
-                nlp = spacy.load(model_name)
-                self.loaded_models[lang_code] = nlp
-                return nlp
+                return load_spacy_model(model_name)
             except OSError as e:
-                logger.error(f"Model for '{lang_code}' could not be loaded: {e}")
+                logger.error("Model for '%s' could not be loaded: %s", lang_code, e)
                 return None
         else:
-            logger.info(f"No model available for language code: '{lang_code}'")
+            logger.info("No model available for language code: '%s'", lang_code)
             return None
 
+    def warmup(self, langs=None):
+        """対応言語のモデルを事前にロードし、最初のタスクでの読み込み待ちをなくす"""
+        for lang_code in langs or self.supported_languages:
+            self.load_model(lang_code)
+
     def tokenize_text(self, lang_code, text):
         """指定された言語のテキストをトークン化し、トークンのリストを返す"""
         nlp = self.load_model(lang_code)
@@ -78,47 +322,22 @@ class TranslationService:
         else:
             return []
 
+    def tokenize_texts(self, lang_code, texts):
+        """複数のテキストをまとめてトークン化し、トークンのリストのリストを返す"""
+        nlp = self.load_model(lang_code)
+        if not nlp:
+            return [[] for _ in texts]
+        return [
+            [token.text for token in doc if token.is_alpha]
+            for doc in nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE)
+        ]
+
     async def extract_text_coordinates_dict(self, pdf_data):
         """
         pdfバイトデータのテキストファイル座標を取得します。
+        ページ数が多い場合はページ範囲ごとに別プロセスで並列に抽出します。
         """
-        # PDFファイルを開く
-        document = await asyncio.to_thread(fitz.open, stream=pdf_data, filetype="pdf")
-
-        content = []
-        for page_num in range(len(document)):
-            # ページを取得
-            page = await asyncio.to_thread(document.load_page, page_num)
-            # ページからテキストブロックを取得
-            text_instances_dict = await asyncio.to_thread(page.get_text, "dict")
-            text_instances = text_instances_dict["blocks"]
-            page_content = []
-
-            for lines in text_instances:
-                block = {}
-                if lines["type"] != 0:
-                    # テキストブロック以外はスキップ
-                    continue
-                block["page_no"] = page_num
-                block["block_no"] = lines["number"]
-                block["coordinates"] = lines["bbox"]
-                block["text"] = ""
-                sizes = []
-                for line in lines["lines"]:
-                    for span in line["spans"]:
-                        if block["text"] == "":
-                            block["text"] += span["text"]
-                        else:
-                            block["text"] += " " + span["text"]
-                        sizes.append(span["size"])
-                        block["font"] = span["font"]
-                block["size"] = np.mean(sizes)
-                # block["text_count"] = len(block["text"])
-                page_content.append(block)
-
-            content.append(page_content)
-        await asyncio.to_thread(document.close)
-        return content
+        return await extract_text_blocks(pdf_data)
 
     def check_first_num_tokens(self, input_list, keywords, num=2):
         for item in input_list[:num]:
@@ -128,39 +347,41 @@ class TranslationService:
         return False
 
     def remove_special_chars(self, text):
-        return "".join(
-            char
-            for char in text
-            if char not in string.punctuation and char not in string.digits
-        )
+        return text.translate(SPECIAL_CHARS_TABLE)
 
     def calculate_token_scores(self, text_list, lang, token_threshold) -> list:
         """
         テキストのリストに対してトークン数を計算し、
         トークン数が指定されたしきい値以下の場合は0、そうでない以外の場合は1を返します。
+        トークンのリストも合わせて返します。
         """
-        tokens_list = [self.tokenize_text(lang, text) for text in text_list]
+        tokens_list = self.tokenize_texts(lang, text_list)
         token_counts = [len(tokens) for tokens in tokens_list]
-        return [
-            0 if count <= token_threshold else 1 for count in token_counts
-        ], token_counts
+        return (
+            [0 if count <= token_threshold else 1 for count in token_counts],
+            token_counts,
+            tokens_list,
+        )
 
     def calculate_percentile_scores(self, data) -> list:
         """
         データのパーセンタイルスコアを計算し、中央値を基準に標準化します。
         """
-        item_median = np.median(data)
-        item_75_percentile = np.percentile(data, 75)
-        item_25_percentile = np.percentile(data, 25)
+        arr = np.asarray(data, dtype=np.float64)
+        # 四分位点と中央値を1回の計算で求める
+        item_25_percentile, item_median, item_75_percentile = np.percentile(
+            arr, [25, 50, 75]
+        )
         iqr = item_75_percentile - item_25_percentile
-        res = [abs((value - item_median) / iqr) if iqr != 0 else 0 for value in data]
-        return res
+        if iqr == 0:
+            return np.zeros_like(arr).tolist()
+        return np.abs((arr - item_median) / iqr).tolist()
 
     def calculate_marge_scores(self, scores):
         """
         トークン数、幅、サイズのスコアをマージし、合計スコアを返します。
         """
-        return [sum(score_list) for score_list in scores]
+        return np.asarray(scores).sum(axis=1)
 
     def calculate_histogram_bins(self, marge_scores, n_neighbours=0) -> tuple:
         """
@@ -169,35 +390,37 @@ class TranslationService:
         0は最頻ビン1個, 1は最頻ビンの両隣を含む最大3個
         """
         # スタージェスの公式によるビン数の計算
-        n = len(marge_scores)
-        num_bins_sturges = math.ceil(math.log2(n) + 1)
+        arr = np.asarray(marge_scores, dtype=np.float64)
+        n = len(arr)
+        num_bins_sturges = math.ceil(math.log2(n) + 1) if n >= 2 else 1
 
         # Freedman-Diaconisの規則によるビン数の計算
-        q75, q25 = np.percentile(marge_scores, [75, 25])
+        # 最小値・四分位点・最大値を1回の計算で求める
+        min_score, q25, q75, max_score = np.percentile(arr, [0, 25, 75, 100])
         iqr = q75 - q25
         bin_width_fd = 2 * iqr / n ** (1 / 3)
-        bin_range = max(marge_scores) - min(marge_scores)
+        bin_range = max_score - min_score
         num_bins_fd = math.ceil(bin_range / bin_width_fd)
 
         # 2つのビン数のうち小さい方を採用
         num_bins = min(num_bins_sturges, num_bins_fd)
-        histogram, bin_edges = np.histogram(marge_scores, bins=num_bins)
+        histogram, bin_edges = np.histogram(arr, bins=num_bins)
 
         logger.info("[Histogram]")
-        logger.info(f"{num_bins=}")
-        logger.info(f"{histogram=}")
-        logger.info(f"{bin_edges=}")
+        logger.info("num_bins=%r", num_bins)
+        logger.info("histogram=%r", histogram)
+        logger.info("bin_edges=%r", bin_edges)
 
         frequent_bins = np.argsort(histogram)[::-1][: n_neighbours + 1]
         res = []
         for b in frequent_bins:
-            logger.info(f"{b=}, {histogram[b]=}")
+            logger.info("b=%r, histogram[b]=%r", b, histogram[b])
             res.append((bin_edges[b], bin_edges[b + 1]))
 
-        logger.info(f"{res=}")
+        logger.info("res=%r", res)
         return res
 
-    async def remove_blocks(self, block_info, token_threshold=15, lang="en") -> list:
+    def remove_blocks(self, block_info, token_threshold=15, lang="en") -> list:
         """
         トークン数が指定された閾値以下のブロックをリストから削除し、
         幅300以上のパーセンタイルブロックをリストから消去します。
@@ -208,27 +431,32 @@ class TranslationService:
         """
         text_blocks, fig_blocks, excluded_blocks = [], [], []
 
-        bboxs = [item["coordinates"] for sublist in block_info for item in sublist]
-        widths = [x1 - x0 for x0, _, x1, _ in bboxs]
-        sizes = [item["size"] for sublist in block_info for item in sublist]
-        text_list = [
-            self.remove_special_chars(item["text"].replace("\n", ""))
-            for sublist in block_info
-            for item in sublist
-        ]
-
-        token_scores, token_counts = self.calculate_token_scores(
+        # ブロック情報を1回の走査で配列に展開する
+        n = sum(len(sublist) for sublist in block_info)
+        bboxs = np.empty((n, 4), dtype=np.float64)
+        sizes = np.empty(n, dtype=np.float64)
+        text_list = [None] * n
+        space_counts = np.empty(n, dtype=np.int64)
+        text_lens = np.empty(n, dtype=np.int64)
+        for idx, item in enumerate(item for sublist in block_info for item in sublist):
+            bboxs[idx] = item["coordinates"]
+            sizes[idx] = item["size"]
+            text_list[idx] = self.remove_special_chars(item["text"].replace("\n", ""))
+            space_counts[idx] = item["text"].count(" ")
+            text_lens[idx] = len(item["text"])
+        widths = bboxs[:, 2] - bboxs[:, 0]
+        # 空白区切りの単語数と空白文字の割合
+        simple_word_counts = space_counts + 1
+        space_ratios = space_counts / np.maximum(text_lens, 1)
+
+        token_scores, token_counts, block_tokens = self.calculate_token_scores(
             text_list, lang, token_threshold
         )
         width_scores = self.calculate_percentile_scores(widths)
         size_scores = self.calculate_percentile_scores(sizes)
 
-        scores = [[token_score] for token_score in token_scores]
-        for width_score, size_score, score_list in zip(
-            width_scores, size_scores, scores
-        ):
-            score_list.append(width_score)
-            score_list.append(size_score)
+        # (ブロック数, 3) の配列: トークン数, 幅, サイズのスコア
+        scores = np.column_stack([token_scores, width_scores, size_scores])
 
         marge_scores = self.calculate_marge_scores(scores)
 
@@ -244,9 +472,9 @@ class TranslationService:
             page_excluded_blocks = []
 
             for block in pages:
-                tokens_list = self.tokenize_text(lang, block["text"])
+                # スコア計算時のトークンを再利用する（先頭2トークンのみ参照）
+                tokens_list = block_tokens[i]
                 score = marge_scores[i]
-                _simple_word_cnt = len(block["text"].split(" "))
 
                 token_score, width_score, size_score = scores[i]
 
@@ -257,10 +485,7 @@ class TranslationService:
                     or second_bin[0] <= score <= second_bin[1]
                 )
                 # 30単語以上かつ、空白文字の割合が40%以下
-                rule3 = (
-                    _simple_word_cnt > 30
-                    and block["text"].count(" ") / len(block["text"]) < 0.4
-                )
+                rule3 = simple_word_counts[i] > 30 and space_ratios[i] < 0.4
                 is_valid_block = (rule1 and rule2) or rule3
 
                 if self.check_first_num_tokens(
@@ -270,16 +495,17 @@ class TranslationService:
                 elif is_valid_block:
                     page_text_blocks.append(block)
                 else:
-                    swapped_block = copy.copy(block)
-                    swapped_block["text"] = (
-                        f"[{score}/{is_valid_block}] /T:{token_score}/{token_counts[i]} /W:{width_score} /S:{size_score}/{sizes[i]} /Text:{block['text']}"
+                    page_excluded_blocks.append(
+                        {
+                            **block,
+                            "text": f"[{score}/{is_valid_block}] /T:{token_score}/{token_counts[i]} /W:{width_score} /S:{size_score}/{sizes[i]} /Text:{block['text']}",
+                        }
                     )
-                    page_excluded_blocks.append(swapped_block)
                 i += 1
 
                 if is_valid_block:
-                    logger.info(f"to translate: {block['text'][:20]}")
-                    logger.info(f"length: {len(block['text'])}")
+                    logger.info("to translate: %s", block["text"][:20])
+                    logger.info("length: %s", len(block["text"]))
 
             text_blocks.append(page_text_blocks)
             fig_blocks.append(page_fig_table_blocks)
@@ -298,7 +524,7 @@ class TranslationService:
                 rect = fitz.Rect(
                     remove_item["coordinates"]
                 )  # テキストブロックの領域を取得
-                await asyncio.to_thread(page.add_redact_annot, rect)
+                page.add_redact_annot(rect)
             await asyncio.to_thread(
                 page.apply_redactions
             )  # レダクションを適用してテキストを削除
@@ -307,12 +533,12 @@ class TranslationService:
         await asyncio.to_thread(
             doc.save, output_buffer, garbage=4, deflate=True, clean=True
         )
-        await asyncio.to_thread(doc.close)
+        doc.close()
 
         output_data = output_buffer.getvalue()
         return output_data
 
-    async def preprocess_write_blocks(self, block_info):
+    def preprocess_write_blocks(self, block_info):
         lh_calc_factor = 1.3
 
         # フォント選択
@@ -323,77 +549,88 @@ class TranslationService:
             font_path = "fonts/MSMINCHO.TTC"
             a_text = "あ"
 
+        # フォントは1回だけ読み込み、文字幅はサイズに比例させて求める
+        font = fitz.Font("F0", font_path)
+        unit_a_width = font.text_length(a_text, 1.0)
+
+        def layout_box_text(box, font_size):
+            """
+            指定したフォントサイズでテキストを各BOXの行に割り付けます。
+            (すべて収まったか, BOXごとのテキストのリスト) を返します。
+            """
+            a_width = unit_a_width * font_size
+
+            # BOXに収まるテキスト数を行ごとにリストに格納
+            max_chars_per_boxes = []
+            for coordinates in box["coordinates"]:
+                x1, y1, x2, y2 = coordinates
+                hight = y2 - y1
+                width = x2 - x1
+
+                num_colums = int(hight / (font_size * lh_calc_factor))
+                num_raw = int(width / a_width)
+                max_chars_per_boxes.append([num_raw] * num_colums)
+
+            # 文字列を改行ごとに分割してリストに格納
+            text_all = box["text"].replace(
+                " ", "\u00a0"
+            )  # スペースを改行されないノーブレークスペースに置き換え
+            text_list = text_all.split("\n")
+
+            text = text_list.pop(0)
+            text_num = len(text)
+            box_texts = []
+            exit_flag = False
+
+            for chars_per_box in max_chars_per_boxes:
+                # 各箱ごとを摘出
+                if exit_flag:
+                    break
+                box_text = ""
+
+                for chars_per_line in chars_per_box:
+                    # 1行あたりに代入できる文字数 : chars_per_line
+                    if exit_flag:
+                        break
+                    # 行に文字を代入した際の残り文字数を計算
+                    text_num = text_num - chars_per_line
+                    if text_num <= 0:
+                        # その行にて収まる場合は、次の文字列を取り出す
+                        box_text += text + "\n"
+                        if text_list == []:
+                            # 次の文字列がない場合はbreak
+                            exit_flag = True
+                            text = ""
+                            break
+                        text = text_list.pop(0)
+                        text_num = len(text)
+
+                if len(text) != text_num:
+                    cut_length = len(text) - text_num
+                    box_text += text[:cut_length]
+                    text = text[cut_length:]
+                box_texts.append(box_text)
+            return text_list == [] and text == "", box_texts
+
         # フォントサイズを逆算+ブロックごとにテキストを分割
         any_blocks = []
         for page in block_info:
             for box in page:
                 font_size = box["size"][0]
-
-                while True:
-                    # 初期化
-                    max_chars_per_boxes = []
-
-                    # フォントサイズ計算
-                    font = fitz.Font("F0", font_path)
-                    a_width = font.text_length(a_text, font_size)
-
-                    # BOXに収まるテキスト数を行ごとにリストに格納
-                    max_chars_per_boxes = []
-                    for coordinates in box["coordinates"]:
-                        x1, y1, x2, y2 = coordinates
-                        hight = y2 - y1
-                        width = x2 - x1
-
-                        num_colums = int(hight / (font_size * lh_calc_factor))
-                        num_raw = int(width / a_width)
-                        max_chars_per_boxes.append([num_raw] * num_colums)
-
-                    # 文字列を改行ごとに分割してリストに格納
-                    text_all = box["text"].replace(
-                        " ", "\u00a0"
-                    )  # スペースを改行されないノーブレークスペースに置き換え
-                    # text_all = box["text"]
-                    text_list = text_all.split("\n")
-
-                    text = text_list.pop(0)
-                    text_num = len(text)
-                    box_texts = []
-                    exit_flag = False
-
-                    for chars_per_box in max_chars_per_boxes:
-                        # 各箱ごとを摘出
-                        if exit_flag:
-                            break
-                        box_text = ""
-
-                        for chars_per_line in chars_per_box:
-                            # 1行あたりに代入できる文字数 : chars_per_line
-                            if exit_flag:
-                                break
-                            # 行に文字を代入した際の残り文字数を計算
-                            text_num = text_num - chars_per_line
-                            # print(F"{chars_per_line}/{text_num}")
-                            if text_num <= 0:
-                                # その行にて収まる場合は、次の文字列を取り出す
-                                box_text += text + "\n"
-                                # print("add str to box")
-                                if text_list == []:
-                                    # 次の文字列がない場合はbreak
-                                    exit_flag = True
-                                    text = ""
-                                    break
-                                text = text_list.pop(0)
-                                text_num = len(text)
-
-                        if len(text) != text_num:
-                            cut_length = len(text) - text_num
-                            box_text += text[:cut_length]
-                            text = text[cut_length:]
-                        box_texts.append(box_text)
-                    if text_list == [] and text == "":
-                        break
-                    else:
-                        font_size -= 0.1
+                is_fit, box_texts = layout_box_text(box, font_size)
+
+                if not is_fit:
+                    # 収まる最大のフォントサイズを二分探索で求める
+                    low, high = min(MIN_WRITE_FONT_SIZE, font_size), font_size
+                    _, box_texts = layout_box_text(box, low)
+                    while high - low > FONT_SIZE_SEARCH_STEP:
+                        mid = (low + high) / 2
+                        is_fit, mid_box_texts = layout_box_text(box, mid)
+                        if is_fit:
+                            low, box_texts = mid, mid_box_texts
+                        else:
+                            high = mid
+                    font_size = low
                 box_texts = [text.lstrip().rstrip("\n") for text in box_texts]
                 for page_no, block_no, coordinates, text in zip(
                     box["page_no"], box["block_no"], box["coordinates"], box_texts
@@ -463,7 +700,7 @@ class TranslationService:
         await asyncio.to_thread(
             doc.save, output_buffer, garbage=4, deflate=True, clean=True
         )
-        await asyncio.to_thread(doc.close)
+        doc.close()
         output_data = output_buffer.getvalue()
 
         return output_data
@@ -510,9 +747,9 @@ class TranslationService:
         await asyncio.to_thread(
             new_doc.save, output_buffer, garbage=4, deflate=True, clean=True
         )
-        await asyncio.to_thread(new_doc.close)
-        await asyncio.to_thread(doc_base.close)
-        await asyncio.to_thread(doc_translate.close)
+        new_doc.close()
+        doc_base.close()
+        doc_translate.close()
         output_data = output_buffer.getvalue()
         return output_data
 
@@ -526,42 +763,77 @@ class TranslationService:
         Returns:
             str: The preprocessed text.
         """
-        _tmp = text.strip("\n")
-        # replace more than 2 newlines with 2 newlines
-        _tmp = re.sub(r"\n{2,}", "\n\n", _tmp)
-        # _tmp = text
-        _tmp = dedent(_tmp)
-        return _tmp
+        return preprocess_text(text)
 
     async def chat_with_llm(
         self,
         system_prompt: str,
         user_prompt: str,
         print_result: bool = False,
+        max_output_chars: int | None = None,
     ) -> str:
+        """
+        LLMに問い合わせて応答を返します。
+        max_output_chars を指定すると応答をストリーミングで受け取り、
+        上限を超えた時点で生成を打ち切って例外を送出します。
+        """
         try:
-            processed_system_prompt = self.text_pre_processing(system_prompt)
             processed_user_prompt = self.text_pre_processing(user_prompt)
             api_params = get_api_params(self.provider, self.api_key)
 
-            response = completion(
-                model=f"{convert_model(self.provider, self.model_name)}",
-                messages=[
-                    {"role": "system", "content": processed_system_prompt},
-                    {"role": "user", "content": processed_user_prompt},
-                ],
-                **api_params,
-            )
+            available = get_provider_available(self.provider)
+            await available.wait()
+            if rate_limiter := get_rate_limiter(self.provider):
+                await rate_limiter.acquire()
+
+            model = f"{convert_model(self.provider, self.model_name)}"
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": processed_user_prompt},
+            ]
+            if max_output_chars is None:
+                response = await acompletion(
+                    model=model, messages=messages, **api_params
+                )
+                content = response.choices[0].message.content
+            else:
+                response = await acompletion(
+                    model=model, messages=messages, stream=True, **api_params
+                )
+                chunks = []
+                output_chars = 0
+                async for chunk in response:
+                    delta = chunk.choices[0].delta.content or ""
+                    chunks.append(delta)
+                    output_chars += len(delta)
+                    if output_chars > max_output_chars:
+                        raise ValueError(
+                            f"llm output exceeded {max_output_chars} characters"
+                        )
+                content = "".join(chunks)
 
             self.count += 1
-            logger.info(f"Progress: {self.count}/{self.length}")
+            logger.info("Progress: %s/%s", self.count, self.length)
 
             if print_result:
                 logger.info(processed_user_prompt)
-                logger.info(response.choices[0].message.content)
-            return response.choices[0].message.content
+                logger.info(content)
+            return content
         except Exception as e:
-            return f"llm chat failed: {str(e)}"
+            # 失敗を翻訳結果として扱わないよう、呼び出し元に伝える
+            logger.error("llm chat failed: %s", e)
+            available = get_provider_available(self.provider)
+            if isinstance(e, LLM_OVERLOAD_ERRORS) and available.is_set():
+                # 過負荷の兆候があれば、同じプロバイダへのリクエストをまとめて一時停止する
+                logger.warning(
+                    "pausing %s requests for %ss", self.provider, LLM_OVERLOAD_PAUSE
+                )
+                available.clear()
+                try:
+                    await asyncio.sleep(LLM_OVERLOAD_PAUSE)
+                finally:
+                    available.set()
+            raise
 
     async def translate_str_data_with_llm(
         self,
@@ -574,20 +846,14 @@ class TranslationService:
                 "message": "llm only supports Japanese translation",
             }
 
-        system_prompt = "You are a world-class translator and will translate English text to Japanese."
         try:
             initial_translation = await self.chat_with_llm(
-                system_prompt,
-                self.text_pre_processing(
-                    """
-                This is a English to Japanese, Literal Translation task.
-                Please provide the Japanese translation for the next sentences.
-                You must not include any chat messages to the user in your response.
-                ---
-                {original_text}
-                """.format(original_text=self.text_pre_processing(text))
+                TRANSLATION_SYSTEM_PROMPT,
+                TRANSLATION_PROMPT_TEMPLATE.format(
+                    original_text=self.text_pre_processing(text)
                 ),
                 self.is_print_progress,
+                max_output_chars=max_translation_chars(text),
             )
 
             # Disabling self-refinement for now, as it is a time-consuming process and
@@ -599,43 +865,18 @@ class TranslationService:
                 }
 
             review_comment = await self.chat_with_llm(
-                system_prompt,
-                self.text_pre_processing(
-                    """
-                Orginal Text(English):
-                {original_text}
-                ---
-                Translated Text(Japanese):
-                {translated_text}
-                ---
-                Is there anything in the above Translated Text that does not conform to the local language's grammar, style, natural tone or cultural norms?
-                Find mistakes and specify corrected phrase and why it is not appropriate.
-                Each bullet should be in the following format:
-
-                * <translated_phrase>
-                    * Corrected: <corrected_phrase>
-                    * Why: <reason>
-                """.format(original_text=text, translated_text=initial_translation)
+                TRANSLATION_SYSTEM_PROMPT,
+                REVIEW_PROMPT_TEMPLATE.format(
+                    original_text=text, translated_text=initial_translation
                 ),
                 self.is_print_progress,
             )
 
             final_translation = await self.chat_with_llm(
-                system_prompt,
-                self.text_pre_processing(
-                    """
-                Orginal Text:
-                {original_text}
-                ---
-                Hints for translation:
-                {review_comments}
-                ---
-                Read the Original Text, and Hits for trasnlation above, then provide complete and accurate Japanese translation.
-                You must not include any chat messages to the user in your response.
-                """.format(
-                        original_text=text,
-                        review_comments=review_comment,
-                    )
+                TRANSLATION_SYSTEM_PROMPT,
+                REFINE_PROMPT_TEMPLATE.format(
+                    original_text=text,
+                    review_comments=review_comment,
                 ),
                 self.is_print_progress,
             )
@@ -648,42 +889,153 @@ class TranslationService:
             "data": final_translation,
         }
 
+    async def translate_texts_with_llm(self, texts: list[str]) -> dict:
+        """
+        複数のテキストを番号付きリストとして1回のリクエストで翻訳します。
+        番号の対応が取れない場合は ok=False を返します。
+        """
+        if self.target_lang.lower() not in ("ja"):
+            return {
+                "ok": False,
+                "message": "llm only supports Japanese translation",
+            }
+
+        # 番号付きリストの1項目が1行に収まるよう改行を空白に置き換える
+        numbered_text = "\n".join(
+            f"{i}. {' '.join(text.split())}" for i, text in enumerate(texts, 1)
+        )
+        try:
+            translation = await self.chat_with_llm(
+                TRANSLATION_SYSTEM_PROMPT,
+                BATCH_TRANSLATION_PROMPT_TEMPLATE.format(numbered_text=numbered_text),
+                self.is_print_progress,
+                max_output_chars=max_translation_chars(numbered_text),
+            )
+        except Exception as e:
+            return {"ok": False, "message": f"llm translation failed: {str(e)}"}
+
+        translated_texts = split_numbered_texts(translation, len(texts))
+        if translated_texts is None:
+            return {"ok": False, "message": "numbered translation did not match"}
+        return {"ok": True, "data": translated_texts}
+
     async def translate_blocks(self, blocks: str):
-        @retry(wait=wait_fixed(2), stop=stop_after_attempt(4))
+        @retry(
+            wait=wait_exponential_jitter(initial=1, max=30), stop=stop_after_attempt(4)
+        )
         async def translate_block(block) -> dict:
             """
             ブロックのテキストを翻訳する非同期関数
             ブロックとは、text, coordinates, block_no, page_no, sizeのキーを持つ辞書を指す
             """
             text = block["text"]
-            if text.strip() == "":
+            if UNTRANSLATABLE_TEXT_PATTERN.fullmatch(text.strip()):
                 return block
 
-            translated_text = await self.translate_str_data_with_llm(text)
+            async with _llm_semaphore:
+                translated_text = await self.translate_str_data_with_llm(text)
             if translated_text["ok"]:
                 block["text"] = translated_text["data"]
                 return block
             else:
                 raise Exception(translated_text["message"])
 
-        tasks = []
+        async def translate_batch(batch) -> None:
+            """
+            隣接する複数ブロックをまとめて翻訳する非同期関数
+            まとめて翻訳できなかった場合はブロックごとに翻訳する
+            """
+            if len(batch) > 1:
+                async with _llm_semaphore:
+                    translated_texts = await self.translate_texts_with_llm(
+                        [block["text"] for block in batch]
+                    )
+                if translated_texts["ok"]:
+                    for block, text in zip(batch, translated_texts["data"]):
+                        block["text"] = text
+                    return
+                logger.warning(
+                    "batch translation failed, falling back to single blocks: %s",
+                    translated_texts["message"],
+                )
+            for block in batch:
+                await translate_block(block)
+
+        # 同一テキストのブロックは1回だけ翻訳する（前後の空白は区別しない）
+        # 数字・URL・図表番号だけのブロックなどは翻訳せずそのまま残す
+        same_text_blocks = defaultdict(list)
+        for page in blocks:
+            for block in page:
+                text = block["text"].strip()
+                if not UNTRANSLATABLE_TEXT_PATTERN.fullmatch(text):
+                    same_text_blocks[text].append(block)
+
+        # 翻訳済みのテキストはキャッシュから埋める
+        model = f"{self.provider}/{self.model_name}"
+        cache_keys = {
+            text: make_cache_key(model, self.source_lang, self.target_lang, text)
+            for text in same_text_blocks
+        }
+        cached_translations = (
+            await get_cached_translations(list(cache_keys.values()))
+            if self.use_cache
+            else {}
+        )
+        logger.info(
+            "translation cache: %s hits, %s misses",
+            len(cached_translations),
+            len(cache_keys) - len(cached_translations),
+        )
+        pending_blocks = {}
+        for text, same_blocks in same_text_blocks.items():
+            cached_text = cached_translations.get(cache_keys[text])
+            if cached_text is None:
+                pending_blocks[text] = same_blocks
+                continue
+            for block in same_blocks:
+                block["text"] = cached_text
+
+        # 空でないブロックを文字数・ブロック数の上限までまとめる
+        batches = []
+        batch = []
+        batch_chars = 0
+        for text in pending_blocks:
+            text_length = len(text)
+            if batch and (
+                len(batch) >= TRANSLATION_BATCH_MAX_BLOCKS
+                or batch_chars + text_length > TRANSLATION_BATCH_MAX_CHARS
+            ):
+                batches.append(batch)
+                batch = []
+                batch_chars = 0
+            batch.append({"text": text})
+            batch_chars += text_length
+        if batch:
+            batches.append(batch)
+
         try:
             async with asyncio.TaskGroup() as tg:
-                for block_idx, page in enumerate(blocks):
-                    for page_idx, block in enumerate(page):
-                        task = tg.create_task(translate_block(block))
-                        tasks.append(((block_idx, page_idx), task))
-                self.length = len(tasks)
-                logger.info(f"generated {len(tasks)} tasks")
+                for batch in batches:
+                    tg.create_task(translate_batch(batch))
+                self.length = len(batches)
+                logger.info("generated %s tasks", len(batches))
                 logger.info("waiting for complete...")
         except Exception as e:
-            logger.error(f"failed to create tasks: {str(e)}")
+            logger.error("failed to create tasks: %s", e)
             raise e
 
         logger.info("completed all tasks")
 
-        for (block_idx, page_idx), task in tasks:
-            blocks[block_idx][page_idx] = task.result()
+        # 翻訳結果を同じテキストを持つすべてのブロックに反映する
+        translated_texts = [item["text"] for batch in batches for item in batch]
+        new_translations = {}
+        for (text, same_blocks), translated_text in zip(
+            pending_blocks.items(), translated_texts
+        ):
+            new_translations[cache_keys[text]] = translated_text
+            for block in same_blocks:
+                block["text"] = translated_text
+        await store_translations(new_translations)
 
         return blocks
 
@@ -695,43 +1047,35 @@ class TranslationService:
         変換結果のblockを返します
         """
         results = []
-
-        text = ""
-        coordinates = []
-        block_no = []
-        page_no = []
-        font_size = []
+        # まだ格納していない連続ブロック（ページをまたいで引き継ぐ）
+        group = []
+        group_chars = 0
 
         for page in blocks:
             page_results = []
             temp_block_no = 0
             for block in page:
-                text += " " + block["text"]
-                page_no.append(block["page_no"])
-                coordinates.append(block["coordinates"])
-                block_no.append(block["block_no"])
-                font_size.append(block["size"])
+                group.append(block)
+                group_chars += len(block["text"])
 
                 if (
-                    text.endswith(end_maker)
+                    block["text"].endswith(end_maker)
                     or block["block_no"] - temp_block_no <= 1
                     or end_maker_enable is False
+                    or group_chars >= TRANSLATION_TARGET_CHARS
                 ):
-                    # マーカーがある場合格納
+                    # マーカーがある場合、または目標文字数に達した場合格納
                     page_results.append(
                         {
-                            "page_no": page_no,
-                            "block_no": block_no,
-                            "coordinates": coordinates,
-                            "text": text,
-                            "size": font_size,
+                            "page_no": [item["page_no"] for item in group],
+                            "block_no": [item["block_no"] for item in group],
+                            "coordinates": [item["coordinates"] for item in group],
+                            "text": " " + " ".join(item["text"] for item in group),
+                            "size": [item["size"] for item in group],
                         }
                     )
-                    text = ""
-                    coordinates = []
-                    block_no = []
-                    page_no = []
-                    font_size = []
+                    group = []
+                    group_chars = 0
                 temp_block_no = block["block_no"]
 
             results.append(page_results)
@@ -742,39 +1086,55 @@ class TranslationService:
             self.block_info = await self.extract_text_coordinates_dict(
                 self.original_pdf_data
             )
-            self.text_blocks, self.fig_blocks, _ = await self.remove_blocks(
-                self.block_info, 10, lang=self.source_lang
+            # spaCyとNumPyによる判定はCPU処理なので、イベントループを止めないよう
+            # スレッドで実行する（同じワーカーで他のタスクも並行して動くため）
+            self.text_blocks, self.fig_blocks, _ = await asyncio.to_thread(
+                self.remove_blocks, self.block_info, 10, lang=self.source_lang
             )
 
             # 翻訳部分を消去したPDFデータを制作
-            removed_textbox_pdf_data = await self.remove_textbox_for_pdf(
-                self.original_pdf_data, self.text_blocks
-            )
-            removed_textbox_pdf_data = await self.remove_textbox_for_pdf(
-                removed_textbox_pdf_data, self.fig_blocks
-            )
-            logger.info("1. Generate removed_textbox_pdf_data")
+            # 本文と図表のブロックをページごとにまとめ、1回のレダクションで消去する
+            redact_blocks = [
+                page_text_blocks + page_fig_blocks
+                for page_text_blocks, page_fig_blocks in zip(
+                    self.text_blocks, self.fig_blocks
+                )
+            ]
+            # レダクションは書き込み時まで不要なので、翻訳と並行して実行する
+            async with asyncio.TaskGroup() as tg:
+                removed_textbox_task = tg.create_task(
+                    self.remove_textbox_for_pdf(self.original_pdf_data, redact_blocks)
+                )
 
-            # 翻訳前のブロック準備
-            preprocess_text_blocks = await self.preprocess_translation_blocks(
-                self.text_blocks, (".", ":", ";"), True
-            )
-            preprocess_fig_blocks = await self.preprocess_translation_blocks(
-                self.fig_blocks, (".", ":", ";"), False
-            )
-            logger.info("2. Generate Prepress_blocks")
+                # 翻訳前のブロック準備
+                preprocess_text_blocks = await self.preprocess_translation_blocks(
+                    self.text_blocks, (".", ":", ";"), True
+                )
+                preprocess_fig_blocks = await self.preprocess_translation_blocks(
+                    self.fig_blocks, (".", ":", ";"), False
+                )
+                logger.info("1. Generate Prepress_blocks")
 
-            # 翻訳実施
-            translate_text_blocks = await self.translate_blocks(preprocess_text_blocks)
-            self.count = 0
-            translate_fig_blocks = await self.translate_blocks(preprocess_fig_blocks)
+                # 翻訳実施
+                translate_text_blocks = await self.translate_blocks(
+                    preprocess_text_blocks
+                )
+                self.count = 0
+                translate_fig_blocks = await self.translate_blocks(
+                    preprocess_fig_blocks
+                )
+            removed_textbox_pdf_data = removed_textbox_task.result()
+            logger.info("2. Generate removed_textbox_pdf_data")
             logger.info("3. translated blocks")
 
             # pdf書き込みデータ作成
-            write_text_blocks = await self.preprocess_write_blocks(
-                translate_text_blocks
+            # レイアウト計算もCPU処理なのでスレッドで実行する
+            write_text_blocks = await asyncio.to_thread(
+                self.preprocess_write_blocks, translate_text_blocks
+            )
+            write_fig_blocks = await asyncio.to_thread(
+                self.preprocess_write_blocks, translate_fig_blocks
             )
-            write_fig_blocks = await self.preprocess_write_blocks(translate_fig_blocks)
             logger.info("4. Generate wirte Blocks")
 
             # pdfの作成
@@ -808,6 +1168,6 @@ class TranslationService:
             self.status = TaskStatus.COMPLETED
             return True, merged_pdf_data
         except Exception as e:
-            logger.error(f"pdf_translate error: {str(e)}")
+            logger.exception("pdf_translate error")
             self.status = TaskStatus.FAILED
             return False, str(e)
@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+from service.db import (
+    MONGO_COLLECTION_TRANSLATION_CACHE,
+    TRANSLATION_CACHE_TTL,
+    db_errors,
+    get_collection,
+)
+from service.storage import PDF_CACHE_PREFIX, delete_files_with_prefix
+
+
+def make_cache_key(model: str, source_lang: str, target_lang: str, text: str) -> str:
+    payload = json.dumps(
+        {"m": model, "s": source_lang, "t": target_lang, "x": text},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@db_errors(default={})
+async def get_cached_translations(keys: list[str]) -> dict[str, str]:
+    """
+    Look up translations by cache key in one query.
+    Keys that are not cached (or have expired) are missing from the result.
+    """
+    if not keys:
+        return {}
+
+    # The TTL monitor only runs periodically, so expired entries are
+    # filtered here as well
+    expires_before = datetime.now(timezone.utc) - timedelta(
+        seconds=TRANSLATION_CACHE_TTL
+    )
+    collection = get_collection(MONGO_COLLECTION_TRANSLATION_CACHE)
+    docs = await asyncio.to_thread(
+        lambda: list(
+            collection.find(
+                {"_id": {"$in": keys}, "created_at": {"$gt": expires_before}},
+                {"text": 1},
+            )
+        )
+    )
+    return {doc["_id"]: doc["text"] for doc in docs}
+
+
+@db_errors(default=False)
+async def store_translations(translations: dict[str, str]) -> bool:
+    """
+    Cache translations by key. Stored entries expire through the TTL index
+    on created_at (see service.db.create_indexes).
+    """
+    if not translations:
+        return True
+
+    now = datetime.now(timezone.utc)
+    collection = get_collection(MONGO_COLLECTION_TRANSLATION_CACHE)
+    await asyncio.to_thread(
+        collection.bulk_write,
+        [
+            UpdateOne(
+                {"_id": key},
+                {"$set": {"text": text, "created_at": now}},
+                upsert=True,
+            )
+            for key, text in translations.items()
+        ],
+        ordered=False,
+    )
+    return True
+
+
+async def purge_translation_cache() -> dict:
+    """
+    Drop cached block translations and cached translated PDFs.
+    Every process reads both from shared storage, so this takes effect in
+    the worker immediately.
+    """
+    collection = get_collection(MONGO_COLLECTION_TRANSLATION_CACHE)
+    result = await asyncio.to_thread(collection.delete_many, {})
+    deleted_pdf_count = await asyncio.to_thread(
+        delete_files_with_prefix, PDF_CACHE_PREFIX
+    )
+    return {
+        "status": "purged",
+        "deleted_count": result.deleted_count,
+        "deleted_pdf_count": deleted_pdf_count,
+    }
@@ -1,18 +1,30 @@
 import asyncio
+import hashlib
 import json
 import os
 import signal
 import sys
 
+import aio_pika
 from discord_webhook import DiscordWebhook
 from pydantic import BaseModel
 
 from service.db import TaskStatus, update_task_status
 from service.log import logger
-from service.mq import TRANSLATION_QUEUE, get_rabbitmq_client, publish_task_update
-from service.storage import download_file, upload_file
+from service.mq import TRANSLATION_QUEUE, get_rabbitmq_connection
+from service.storage import (
+    PDF_CACHE_PREFIX,
+    copy_file,
+    download_file,
+    file_exists,
+    upload_file,
+)
 from service.translate import TranslationService
 
+# Translations processed at once; also the number of unacknowledged messages
+# the broker hands to this worker
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+
 
 class TranslationTask(BaseModel):
     task_id: str
@@ -25,6 +37,8 @@ class TranslationTask(BaseModel):
     provider: str = None
     model_name: str = None
     api_key: str = None
+    # False forces a fresh translation, replacing any cached result
+    use_cache: bool = True
 
 
 async def process_translation_task(task_data):
@@ -33,72 +47,83 @@ async def process_translation_task(task_data):
     try:
         # Update task status to processing
         await update_task_status(task.task_id, TaskStatus.PROCESSING.value)
-        await publish_task_update(task.task_id, TaskStatus.PROCESSING.value)
 
         logger.info(
-            f"Processing translation task {task.task_id} for file {task.filename}"
+            "Processing translation task %s for file %s", task.task_id, task.filename
         )
 
         # Download the PDF data from storage
         try:
             original_pdf_data = await download_file(f"uploads/{task.filename}")
-            logger.info(f"Downloaded PDF data for task {task.task_id}")
+            logger.info("Downloaded PDF data for task %s", task.task_id)
         except Exception as e:
-            error_msg = f"Failed to download PDF data: {str(e)}"
-            logger.error(f"{error_msg} for task {task.task_id}")
+            logger.error("Failed to download PDF data for task %s: %s", task.task_id, e)
             await update_task_status(task.task_id, TaskStatus.FAILED.value)
-            await publish_task_update(task.task_id, TaskStatus.FAILED.value, error_msg)
-            return False
-
-        # Create translation service
-        ts = TranslationService()
-        ts.task_id = task.task_id
-        ts.status = TaskStatus.PROCESSING
-        ts.original_pdf_data = original_pdf_data
-        ts.filename = task.filename
-        ts.content_type = task.content_type
-        ts.original_url = task.original_url
-        ts.translated_url = task.translated_url
-        ts.source_lang = task.source_lang
-        ts.target_lang = task.target_lang
-        ts.provider = task.provider
-        ts.model_name = task.model_name
-        ts.api_key = task.api_key
-
-        # Perform the translation
-        is_success, result_data = await ts.pdf_translate()
-
-        if not is_success:
-            logger.error(f"Translation failed for task {task.task_id}: {result_data}")
-            await update_task_status(task.task_id, TaskStatus.FAILED.value)
-            await publish_task_update(
-                task.task_id,
-                TaskStatus.FAILED.value,
-                f"Translation failed: {result_data}",
-            )
             return False
 
-        # Upload the translated file
+        pdf_hash = await asyncio.to_thread(
+            lambda: hashlib.sha256(original_pdf_data).hexdigest()
+        )
+        cache_key = get_pdf_cache_key(task, pdf_hash)
         upload_key = f"translated/{task.filename}"
-        is_upload_success = await upload_file(
-            result_data, upload_key, task.content_type
+
+        # Serve an earlier translation of the same PDF with a server-side copy
+        is_cached = (
+            task.use_cache
+            and await file_exists(cache_key)
+            and await copy_file(cache_key, upload_key)
         )
+        if is_cached:
+            logger.info("Using cached translation for task %s", task.task_id)
+        else:
+            # Create translation service
+            ts = TranslationService()
+            ts.task_id = task.task_id
+            ts.status = TaskStatus.PROCESSING
+            ts.original_pdf_data = original_pdf_data
+            ts.filename = task.filename
+            ts.content_type = task.content_type
+            ts.original_url = task.original_url
+            ts.translated_url = task.translated_url
+            ts.source_lang = task.source_lang
+            ts.target_lang = task.target_lang
+            ts.provider = task.provider
+            ts.model_name = task.model_name
+            ts.api_key = task.api_key
+            ts.use_cache = task.use_cache
+
+            # Perform the translation
+            is_success, result_data = await ts.pdf_translate()
+
+            if not is_success:
+                logger.error(
+                    "Translation failed for task %s: %s", task.task_id, result_data
+                )
+                await update_task_status(task.task_id, TaskStatus.FAILED.value)
+                return False
 
-        if not is_upload_success:
-            logger.error(f"Failed to upload translated file for task {task.task_id}")
-            await update_task_status(task.task_id, TaskStatus.FAILED.value)
-            await publish_task_update(
-                task.task_id,
-                TaskStatus.FAILED.value,
-                "Failed to upload translated file",
+            # Upload the translated file
+            is_upload_success = await upload_file(
+                result_data, upload_key, task.content_type
             )
-            return False
+
+            if not is_upload_success:
+                logger.error(
+                    "Failed to upload translated file for task %s", task.task_id
+                )
+                await update_task_status(task.task_id, TaskStatus.FAILED.value)
+                return False
+
+            # Keep a server-side copy so the next identical request skips translation
+            if not await copy_file(upload_key, cache_key):
+                logger.warning(
+                    "Failed to cache translated file for task %s", task.task_id
+                )
 
         # Update task status to completed
         await update_task_status(task.task_id, TaskStatus.COMPLETED.value)
-        await publish_task_update(task.task_id, TaskStatus.COMPLETED.value)
 
-        logger.info(f"Translation completed successfully for task {task.task_id}")
+        logger.info("Translation completed successfully for task %s", task.task_id)
 
         # Send Discord notification
         if webhook_url := os.getenv("DISCORD_WEBHOOK_URL"):
@@ -107,82 +132,105 @@ async def process_translation_task(task_data):
                     url=webhook_url,
                     content=f"翻訳が完了しました！[{task.filename}]({task.translated_url})",
                 )
-                webhook.execute()
+                await asyncio.to_thread(webhook.execute)
                 logger.info(
-                    f"Discord notification sent for completed task {task.task_id}"
+                    "Discord notification sent for completed task %s", task.task_id
                 )
             except Exception as e:
-                logger.error(f"Failed to send Discord notification: {str(e)}")
+                logger.error("Failed to send Discord notification: %s", e)
 
         return True
 
-    except Exception as e:
-        logger.error(f"Error processing translation task {task.task_id}: {str(e)}")
+    except Exception:
+        logger.exception("Error processing translation task %s", task.task_id)
         await update_task_status(task.task_id, TaskStatus.FAILED.value)
-        await publish_task_update(
-            task.task_id, TaskStatus.FAILED.value, f"Error: {str(e)}"
-        )
         return False
 
 
-def callback(ch, method, properties, body):
+def get_pdf_cache_key(task: TranslationTask, pdf_hash: str) -> str:
+    return (
+        f"{PDF_CACHE_PREFIX}{pdf_hash}/{task.provider}/{task.model_name}/"
+        f"{task.source_lang}-{task.target_lang}"
+    )
+
+
+async def handle_message(body: bytes):
     """
-    Callback function for RabbitMQ message processing.
+    Decode a RabbitMQ message and process the translation task.
     """
     try:
         task_data = json.loads(body)
-        logger.info(f"Received task: {task_data.get('task_id')}")
+        logger.info("Received task: %s", task_data.get("task_id"))
 
         # Process the translation task
-        loop = asyncio.get_event_loop()
-        result = loop.run_until_complete(process_translation_task(task_data))
+        result = await process_translation_task(task_data)
 
         if result:
-            logger.info(f"Task {task_data.get('task_id')} processed successfully")
+            logger.info("Task %s processed successfully", task_data.get("task_id"))
         else:
-            logger.error(f"Task {task_data.get('task_id')} processing failed")
+            logger.error("Task %s processing failed", task_data.get("task_id"))
 
-    except Exception as e:
-        logger.error(f"Error in task callback: {str(e)}")
-    finally:
-        # Acknowledge the message to remove it from the queue
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except Exception:
+        logger.exception("Error in task callback")
 
 
-def start_worker():
-    logger.info("Starting translation worker...")
+async def process_message(
+    message: aio_pika.abc.AbstractIncomingMessage, semaphore: asyncio.Semaphore
+):
     try:
-        # Set up RabbitMQ connection
-        connection = get_rabbitmq_client()
-        channel = connection.channel()
+        # Acknowledge the message to remove it from the queue
+        async with message.process():
+            await handle_message(message.body)
+    finally:
+        semaphore.release()
 
-        # Declare the queue
-        channel.queue_declare(queue=TRANSLATION_QUEUE, durable=True)
 
-        # Don't give more than one message to a worker at a time
-        channel.basic_qos(prefetch_count=1)
+async def consume_tasks():
+    # Load the spaCy models before the first task arrives
+    await asyncio.to_thread(TranslationService().warmup)
 
-        # Set up the consumer
-        channel.basic_consume(queue=TRANSLATION_QUEUE, on_message_callback=callback)
+    semaphore = asyncio.Semaphore(WORKER_CONCURRENCY)
+    # Keep references so running tasks are not garbage collected
+    running_tasks = set()
 
-        logger.info("Worker started, waiting for messages...")
-        channel.start_consuming()
+    # Set up RabbitMQ connection
+    connection = await get_rabbitmq_connection()
+    async with connection:
+        channel = await connection.channel()
 
+        # Limit how many messages the broker hands to this worker at a time
+        await channel.set_qos(prefetch_count=WORKER_CONCURRENCY)
+
+        # Declare the queue
+        queue = await channel.declare_queue(TRANSLATION_QUEUE, durable=True)
+
+        logger.info(
+            "Worker started with concurrency %d, waiting for messages...",
+            WORKER_CONCURRENCY,
+        )
+        async with queue.iterator() as queue_iter:
+            async for message in queue_iter:
+                # Wait for a free slot so translations overlap up to the limit
+                await semaphore.acquire()
+                task = asyncio.create_task(process_message(message, semaphore))
+                running_tasks.add(task)
+                task.add_done_callback(running_tasks.discard)
+
+
+def start_worker():
+    logger.info("Starting translation worker...")
+    try:
+        asyncio.run(consume_tasks())
     except KeyboardInterrupt:
-        logger.info("Worker stopping...")
-        if "channel" in locals() and channel:
-            channel.stop_consuming()
-        if "connection" in locals() and connection:
-            connection.close()
         logger.info("Worker stopped")
-    except Exception as e:
-        logger.error(f"Worker error: {str(e)}")
+    except Exception:
+        logger.exception("Worker error")
         sys.exit(1)
 
 
 def handle_signal(sig, frame):
     """Handle signals to gracefully shutdown the worker."""
-    logger.info(f"Received signal {sig}, shutting down worker...")
+    logger.info("Received signal %s, shutting down worker...", sig)
     sys.exit(0)
 
 